@@ -2,14 +2,33 @@
 # Four spaces as indentation [no tabs]
 
 import re
+import contextlib
+import copy
+import sys
 import itertools
 import warnings
-import copy
-
-
+import hashlib
+import io
+import json
+import os
+import pickle
+import tempfile
+import uuid
+import profiler
+
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from action import Action
+from fluent import Fluent
+from ground_store import GroundActionStore
+from type_index import TypeIndex
+from writer import COMPRESSIONS, OutputWriter
+
+# The outputs that can be asked for: mAp, PDKB-PDDL or both
+TARGETS = ('efp', 'pdkb', 'all')
 
 class EPDDL_Parser:
 
@@ -19,93 +38,145 @@ class EPDDL_Parser:
     # Tokens
     #-----------------------------------------------
 
+    TOKEN_RE = re.compile(r'\]\(|[()\[\]]|[^\s()\[\]]+')
+
     def scan_tokens(self, filename):
         try:
-            with open(filename,'r') as f:
-                # Remove single line comments
-                str = re.sub(r';.*$', '', f.read(), flags=re.MULTILINE).lower()
-                str = re.sub(r'\[([^[]+)-agent(\s+|)\]', r'[\1]',str,flags=re.MULTILINE)
-
-                nb_rep = 1
-
-                while (nb_rep):
-                        (str, nb_rep) = re.subn(r'\((\s|)+\(([^()]+)\)(\s|)+\)', r'\2',str,flags=re.MULTILINE)
-
-                nb_rep = 1
-
-                while (nb_rep):
-                    (str, nb_rep) = re.subn(r'(\[[^[]+\])\(([^(]+)\)', r'\1\2',str,flags=re.MULTILINE)
-
-            # Tokenize
-            stack = []
-            list = []
-            isBF = 0
-            insideBF = 0
-            firstAg = 1
-            countSqPa = 0
-            multi_ag = 0
-            Bf_string = ''
-            for t in re.findall(r'[()\[\]]|[^\s()\[\]]+', str):
-                if t == '(':
-                    stack.append(list)
-                    list = []
-                elif t == ')':
-                    if stack:
-                        l = list
-                        list = stack.pop()
-                        list.append(l)
+            with open(filename,'r') as f, profiler.phase('tokenize'):
+                return self.tokenize(f)
+
+        except Exception as e: print(e)
+
+    def scan_text(self, text):
+        if type(text) is bytes:
+            text = text.decode('utf-8')
+        with profiler.phase('tokenize'):
+            return self.tokenize(io.StringIO(text))
+
+    def tokenize(self, lines):
+        # Single pass over the text: comments are stripped and the input is
+        # lowercased line by line, while the rewrites that used to be regex
+        # fixpoints are applied when each group is closed:
+        #   - '-agent' suffixes are dropped inside '[...]';
+        #   - '((...))' around a group without parentheses is removed;
+        #   - '[ag](...)' around a group without parentheses is folded so that
+        #     its content follows the 'B(ag,' ('C(ag1,ag2,' for more agents) token.
+        # Each frame is [items, groups, lists, last_atomic, fold] where 'groups'
+        # counts the child groups still present after the '((...))' rewrite,
+        # 'lists' the child groups kept as nested lists, 'last_atomic' whether
+        # the last nested list had no groups itself and 'fold' whether the
+        # group was opened right after a ']'.
+        stack = []
+        frame = [[], 0, 0, False, False]
+        items = frame[0]
+        insideBF = 0
+        agents = []
+        for line in lines:
+            for t in self.TOKEN_RE.findall(line.split(';', 1)[0].lower()):
+                if insideBF == 1:
+                    if t == ']' or t == '](':
+                        insideBF = 0
+                        if agents and agents[-1].endswith('-agent') and (len(agents[-1]) > 6 or len(agents) > 1):
+                            agents[-1] = agents[-1][:-6]
+                            if not agents[-1]:
+                                agents.pop()
+                        if len(agents) > 1:
+                            items.append('C(' + ','.join(agents) + ',')
+                        else:
+                            items.append('B(' + ','.join(agents) + ',')
+                        if t == '](':
+                            stack.append(frame)
+                            frame = [[], 0, 0, False, True]
+                            items = frame[0]
+                    elif t == '[':
+                        agents = []
                     else:
+                        agents.append(t)
+                elif t == '(':
+                    stack.append(frame)
+                    frame = [[], 0, 0, False, False]
+                    items = frame[0]
+                elif t == ')':
+                    if not stack:
                         raise Exception('Missing open parentheses')
+                    group = frame
+                    frame = stack.pop()
+                    if group[1] == 1 and group[2] == 1 and len(items) == 1 and group[3] and items[0]:
+                        # '((...))': both parentheses disappear
+                        self.splice_tokens(frame, items[0])
+                    elif group[4] and items and group[2] == 0:
+                        # '[ag](...)': the parentheses disappear
+                        self.splice_tokens(frame, items)
+                        frame[1] += 1
+                    else:
+                        frame[0].append(items)
+                        frame[1] += 1
+                        frame[2] += 1
+                        frame[3] = group[1] == 0
+                    items = frame[0]
                 elif t == '[':
-                    firstAg = 1
                     insideBF = 1
-                    Bf_string = 'B('
-                elif t == ']':
-                    insideBF = 0
-                    Bf_string += ','
-                    if multi_ag == 1:
-                        Bf_string = Bf_string.replace('B(', 'C(')
-                    list.append(Bf_string)
-                    multi_ag = 0
-                elif insideBF == 1:
-                    if firstAg == 0:
-                        multi_ag = 1
-                        Bf_string +=','
-                    Bf_string +=t
-                    firstAg = 0
+                    agents = []
+                elif t == ']' or t == '](':
+                    raise Exception('Unexpected \']\'')
                 else:
-                    list.append(t)
-            if stack:
-                raise Exception('Missing close parentheses')
-            if len(list) != 1:
-                raise Exception('Malformed expression')
-            return list[0]
-
-        except Exception as e: print(e)
+                    items.append(t)
+        if stack:
+            raise Exception('Missing close parentheses')
+        if len(items) != 1:
+            raise Exception('Malformed expression')
+        return items[0]
+
+    def splice_tokens(self, frame, items):
+        if frame[0]:
+            frame[0].extend(items)
+        else:
+            frame[0] = items
 
     #-----------------------------------------------
     # Parse domain
     #-----------------------------------------------
 
-    def parse_domain(self, domain_filename):
-        tokens = self.scan_tokens(domain_filename)
-        if type(tokens) is list and tokens.pop(0) == 'define':
+    def parse_domain(self, domain_filename, cache_folder = None):
+        # With a cache_folder, the parsed domain is loaded from (or saved to)
+        # a snapshot keyed by the hash of the file, without tokenizing it
+        with profiler.phase('parse_domain'):
+            if cache_folder is None:
+                self.parse_domain_tokens(self.scan_tokens(domain_filename), 'File ' + domain_filename)
+                return
+            with open(domain_filename, 'rb') as f:
+                text = f.read()
+            path = os.path.join(cache_folder, hashlib.sha256(text).hexdigest() + '.domain')
+            if not self.load_domain(path):
+                self.parse_domain_tokens(self.scan_text(text), 'File ' + domain_filename)
+                self.save_domain(path)
+
+    def parse_domain_text(self, text):
+        # text is the E-PDDL domain as a string (or as UTF-8 bytes)
+        with profiler.phase('parse_domain'):
+            self.parse_domain_tokens(self.scan_text(text), 'Domain text')
+
+    def parse_domain_tokens(self, tokens, source):
+        if type(tokens) is list and tokens[0] == 'define':
+            # Comments and spacing do not change the hash of the domain
+            self.domain_hash = hashlib.sha256(repr(tokens).encode('utf-8')).hexdigest()
             self.domain_name = 'unknown'
             self.requirements = []
             self.types = {}
             self.objects = {}
             self.actions = []
+            self.action_names = set()
             self.predicates = {}
-            while tokens:
-                group = tokens.pop(0)
-                t = group.pop(0)
+            for group in itertools.islice(tokens, 1, None):
+                group = deque(group)
+                t = group.popleft()
                 if t == 'domain':
                     self.domain_name = group[0]
                 elif t == ':requirements':
                     for req in group:
                         if not req in self.SUPPORTED_REQUIREMENTS:
                             raise Exception('Requirement ' + req + ' not supported')
-                    self.requirements = group
+                    self.requirements = list(group)
                 elif t == ':constants':
                     self.parse_objects(group, t)
                 elif t == ':predicates':
@@ -115,12 +186,54 @@ class EPDDL_Parser:
                 elif t == ':action':
                     self.parse_action(group)
                 else: self.parse_domain_extended(t, group)
+            # The constants, before any problem adds its objects
+            self.domain_objects = {}
+            for obj_type in self.objects:
+                self.domain_objects[obj_type] = list(self.objects[obj_type])
         else:
-            raise Exception('File ' + domain_filename + ' does not match domain pattern')
+            raise Exception(source + ' does not match domain pattern')
 
     def parse_domain_extended(self, t, group):
         print(str(t) + ' is not recognized in domain')
 
+    #-----------------------------------------------
+    # Domain snapshots
+    #-----------------------------------------------
+
+    # Changing the parsing of domains (or the classes it builds) must change this version
+    DOMAIN_SNAPSHOT_VERSION = 3
+    DOMAIN_SNAPSHOT_FIELDS = ('domain_name', 'requirements', 'types', 'objects', 'actions', 'predicates', 'domain_objects', 'domain_hash')
+
+    def load_domain(self, path):
+        # Returns False if there is no usable snapshot in path
+        try:
+            with open(path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception:
+            return False
+        if snapshot.get('version') != self.DOMAIN_SNAPSHOT_VERSION:
+            return False
+        for field in self.DOMAIN_SNAPSHOT_FIELDS:
+            setattr(self, field, snapshot[field])
+        return True
+
+    def save_domain(self, path):
+        snapshot = {'version': self.DOMAIN_SNAPSHOT_VERSION}
+        for field in self.DOMAIN_SNAPSHOT_FIELDS:
+            snapshot[field] = getattr(self, field)
+        # Written with a unique temporary name and renamed when complete, so
+        # that concurrent conversions neither share a file nor read a partial one
+        temporary_path = path + '.' + uuid.uuid4().hex + '.tmp'
+        try:
+            Path(os.path.dirname(path) or '.').mkdir(parents=True, exist_ok=True)
+            with open(temporary_path, 'wb') as out:
+                pickle.dump(snapshot, out, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, path)
+        except OSError:
+            # The snapshot is only an optimization: the conversion goes on without it
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
     #-----------------------------------------------
     # Parse hierarchy
     #-----------------------------------------------
@@ -133,14 +246,14 @@ class EPDDL_Parser:
             elif group[0] == '-':
                 if not list:
                     raise Exception('Unexpected hyphen in ' + name)
-                group.pop(0)
-                type = group.pop(0)
+                group.popleft()
+                type = group.popleft()
                 if not type in structure:
                     structure[type] = []
                 structure[type] += list
                 list = []
             else:
-                list.append(group.pop(0))
+                list.append(group.popleft())
         if list:
             if not 'object' in structure:
                 structure['object'] = []
@@ -154,7 +267,7 @@ class EPDDL_Parser:
             elif group[0] == '-':
                 raise Exception('Unexpected hyphen in ' + name)
             else:
-                list.append(group.pop(0))
+                list.append(group.popleft())
         if list:
             if not 'agent' in structure:
                 structure['agent'] = []
@@ -183,23 +296,24 @@ class EPDDL_Parser:
 
     def parse_predicates(self, group):
         for pred in group:
-            predicate_name = pred.pop(0)
+            pred = deque(pred)
+            predicate_name = pred.popleft()
             if predicate_name in self.predicates:
                 raise Exception('Predicate ' + predicate_name + ' redefined')
             arguments = {}
-            untyped_variables = []
+            untyped_variables = deque()
             while pred:
-                t = pred.pop(0)
+                t = pred.popleft()
                 if t == '-':
                     if not untyped_variables:
                         raise Exception('Unexpected hyphen in predicates')
-                    type = pred.pop(0)
+                    type = pred.popleft()
                     while untyped_variables:
-                        arguments[untyped_variables.pop(0)] = type
+                        arguments[untyped_variables.popleft()] = type
                 else:
                     untyped_variables.append(t)
             while untyped_variables:
-                arguments[untyped_variables.pop(0)] = 'object'
+                arguments[untyped_variables.popleft()] = 'object'
             self.predicates[predicate_name] = arguments
 
 
@@ -209,12 +323,12 @@ class EPDDL_Parser:
     #-----------------------------------------------
 
     def parse_action(self, group):
-        name = group.pop(0)
+        name = group.popleft()
         if not type(name) is str:
             raise Exception('Action without name definition')
-        for act in self.actions:
-            if act.name == name:
-                raise Exception('Action ' + name + ' redefined')
+        if name in self.action_names:
+            raise Exception('Action ' + name + ' redefined')
+        self.action_names.add(name)
         parameters = []
         act_type = 'ontic'
         positive_preconditions = []
@@ -227,45 +341,45 @@ class EPDDL_Parser:
         explicit_eff = []
         extensions = None
         while group:
-            t = group.pop(0)
+            t = group.popleft()
             if t == ':parameters':
-                if not type(group) is list:
+                if not group or not type(group[0]) is list:
                     raise Exception('Error with ' + name + ' parameters')
                 parameters = []
-                untyped_parameters = []
-                p = group.pop(0)
+                untyped_parameters = deque()
+                p = deque(group.popleft())
                 while p:
-                    t = p.pop(0)
+                    t = p.popleft()
                     if t == '-':
                         if not untyped_parameters:
                             raise Exception('Unexpected hyphen in ' + name + ' parameters')
-                        ptype = p.pop(0)
+                        ptype = p.popleft()
                         while untyped_parameters:
-                            parameters.append([untyped_parameters.pop(0), ptype])
+                            parameters.append([untyped_parameters.popleft(), ptype])
                     else:
                         untyped_parameters.append(t)
                 while untyped_parameters:
-                    parameters.append([untyped_parameters.pop(0), 'object'])
+                    parameters.append([untyped_parameters.popleft(), 'object'])
             elif t == ':act_type':
-                act_type = self.assign_act_type(group.pop(0))
+                act_type = self.assign_act_type(group.popleft())
             elif t == ':precondition':
-                self.split_predicates(group.pop(0), positive_preconditions, negative_preconditions, name, ' preconditions')
+                self.split_predicates(group.popleft(), positive_preconditions, negative_preconditions, name, ' preconditions')
             elif t == ':effect':
-                #self.split_effects(group.pop(0), add_effects, del_effects, name, ' effects')
-                self.recoursive_reading(group.pop(0), [['']], [['']], [['']], 0, add_effects, del_effects, name, ' effects')
+                #self.split_effects(group.popleft(), add_effects, del_effects, name, ' effects')
+                self.recoursive_reading(group.popleft(), [], [], [], 0, add_effects, del_effects, name, ' effects')
 
             #    print(str([list(i) for i in add_effects]))
             #    print(str([list(i) for i in del_effects]))
             elif t == ':observers':
-                #self.read_observer(group.pop(0), f_obs, name, ' agents')
-                self.recoursive_reading(group.pop(0), [['']], [['']], [['']], 0, f_obs, [], name, ' agents')
+                #self.read_observer(group.popleft(), f_obs, name, ' agents')
+                self.recoursive_reading(group.popleft(), [], [], [], 0, f_obs, [], name, ' agents')
 
             elif t == ':p_observers':
-                self.recoursive_reading(group.pop(0), [['']], [['']], [['']], 0, p_obs, [], name, ' agents')
+                self.recoursive_reading(group.popleft(), [], [], [], 0, p_obs, [], name, ' agents')
             elif t == ":derive":
-                derive_cond = group.pop(0)
+                derive_cond = group.popleft()
             elif t == ":exp_effect":
-                explicit_eff = group.pop(0)
+                explicit_eff = group.popleft()
             else: extensions = self.parse_action_extended(t, group)
         self.actions.append(Action(name, act_type, parameters, positive_preconditions, negative_preconditions, add_effects, del_effects, f_obs, p_obs, derive_cond, explicit_eff, extensions))
 
@@ -277,21 +391,34 @@ class EPDDL_Parser:
     #-----------------------------------------------
 
     def parse_problem(self, problem_filename):
+        with profiler.phase('parse_problem'):
+            self.parse_problem_tokens(self.scan_tokens(problem_filename), 'File ' + problem_filename)
+
+    def parse_problem_text(self, text):
+        # text is the E-PDDL problem as a string (or as UTF-8 bytes)
+        with profiler.phase('parse_problem'):
+            self.parse_problem_tokens(self.scan_text(text), 'Problem text')
+
+    def parse_problem_tokens(self, tokens, source):
 
         #Default depth value
         self.depth = 2
 
         def frozenset_of_tuples(data):
             return frozenset([tuple(t) for t in data])
-        tokens = self.scan_tokens(problem_filename)
-        if type(tokens) is list and tokens.pop(0) == 'define':
+        if type(tokens) is list and tokens[0] == 'define':
+            # A new problem is a new conversion: the fluents interned for the
+            # previous one (e.g. if it failed before printing) are not needed
+            Fluent.table.clear()
+            # The objects of a problem parsed before by this parser are dropped
+            self.objects = self.copy_domain_objects()
             self.problem_name = 'unknown'
             self.state = frozenset()
             self.positive_goals = frozenset()
             self.negative_goals = frozenset()
-            while tokens:
-                group = tokens.pop(0)
-                t = group.pop(0)
+            for group in itertools.islice(tokens, 1, None):
+                group = deque(group)
+                t = group.popleft()
                 if t == 'problem':
                     self.problem_name = group[0]
                 elif t == ':domain':
@@ -310,19 +437,23 @@ class EPDDL_Parser:
                 #    tmp_group = []
                 #    tmp_group.insert(0, 'and')
                 #    tmp_group.insert(1, group)
-                    group.insert(0,'and')
+                    group.appendleft('and')
                     self.split_predicates(group, init, [], '', 'init')
-                    self.state = init
+                    self.state = [Fluent.of(ini_f) for ini_f in init]
                 elif t == ':goal':
                     positive_goals = []
                     negative_goals = []
-                    group.insert(0,'and')
+                    group.appendleft('and')
                     self.split_predicates(group, positive_goals, negative_goals, '', 'goals')
-                    self.positive_goals = positive_goals
-                    self.negative_goals = negative_goals
+                    self.positive_goals = [Fluent.of(goal_f) for goal_f in positive_goals]
+                    self.negative_goals = [Fluent.of(goal_f) for goal_f in negative_goals]
                 else: self.parse_problem_extended(t, group)
+            # Objects of each type (with its subtypes) and types of each object
+            self.type_index = TypeIndex(self.objects, self.types)
+            # The forall observers' conditions expanded over the agents of the problem
+            self.observer_templates = {}
         else:
-            raise Exception('File ' + problem_filename + ' does not match problem pattern')
+            raise Exception(source + ' does not match problem pattern')
 
     def parse_problem_extended(self, t, group):
         print(str(t) + ' is not recognized in problem')
@@ -332,29 +463,25 @@ class EPDDL_Parser:
     #-----------------------------------------------
 
     def split_predicates(self, group, positive, negative, name, part):
-        if not type(group) is list:
+        if not type(group) in (list, deque):
             raise Exception('Error with ' + name + part)
         if group[0] == 'and':
-            group.pop(0)
+            group = itertools.islice(group, 1, None)
         else:
             group = [group]
         for predicate in group:
             if 'B(' in predicate[0] or 'C(' in predicate[0]:
-                if type(predicate[1]) is list:
-                    if predicate[1][0] == 'not':
-                        if len(predicate[1][1]) > 0:
-                            i = 0
-                            tmp_predicate=[]
-                            tmp_predicate.insert(0,predicate[0])
-                            while i < len(predicate[1][1]):
-                                if (i == 0):
-                                    tmp_predicate.insert(i+1,'-'+predicate[1][1][0])
-                                else:
-                                    tmp_predicate.insert(i+1,predicate[1][1][i])
-                                i = i+1
-                            predicate = tmp_predicate
-                        else:
-                            raise Exception('Expected predicate after a \'not\'')
+                # A negation under beliefs, ([a]([b](not (p x)))), is scanned as
+                # ['B(a,', ['B(b,', ['not', ['p', 'x']]]]: read as ['B(a,', 'B(b,', '-p', 'x']
+                beliefs = []
+                nested = predicate
+                while len(nested) == 2 and type(nested[1]) is list and ('B(' in nested[0] or 'C(' in nested[0]):
+                    beliefs.append(nested[0])
+                    nested = nested[1]
+                if beliefs and nested[0] == 'not':
+                    if len(nested) != 2 or len(nested[1]) == 0:
+                        raise Exception('Expected predicate after a \'not\'')
+                    predicate = beliefs + ['-' + nested[1][0]] + list(nested[1][1:])
 
             if predicate[0] == 'not':
                 if len(predicate) != 2:
@@ -364,6 +491,8 @@ class EPDDL_Parser:
                 positive.append(predicate)
 
     def recoursive_reading(self, body, head_positive, head_negative, diff, subProcedure, positive, negative, name, part):
+        # Effects and observers are read as (body, positive conditions, negative
+        # conditions, diff) tuples; without a when (or a diff) the lists are empty
         if not type(body) is list:
             raise Exception('Error with ' + name + part)
 
@@ -396,18 +525,18 @@ class EPDDL_Parser:
             if (condition[0] == 'when' or condition[0] == 'forall'):
                 raise Exception('Error with ' + name + part + ' you cannot embed other keywords, other than \'and\', in the \'when\' condition')
             elif condition[0] == 'and':
-                condition = self.recoursive_reading(condition, [['']], [['']], [['']], 1, positive, negative, name, part)
+                condition = self.recoursive_reading(condition, [], [], [], 1, positive, negative, name, part)
                 pos_condition = condition[0]
                 neg_condition = condition[1]
 
             elif condition[0] == 'not':
                 condition.pop(0)
                 neg_condition = condition
-                pos_condition = [['']]
+                pos_condition = []
 
             else:
                 pos_condition = [condition]
-                neg_condition = [['']]
+                neg_condition = []
 
             rule = body[0]
             body.pop(0)
@@ -445,9 +574,9 @@ class EPDDL_Parser:
                         if '?' in v:
                             if v in rule:
                                 rule[rule.index(v)] =  fa_start + rule[rule.index(v)] + fa_stop
-                                self.recoursive_reading(rule,[['']], [['']],[['']], subProcedure, positive, negative, name, part)
+                                self.recoursive_reading(rule, [], [], [], subProcedure, positive, negative, name, part)
                             elif rule[0] == 'when':
-                                parsed_rule = self.recoursive_reading(rule,[['']], [['']],[['']], 1, positive, negative, name, part)
+                                parsed_rule = self.recoursive_reading(rule, [], [], [], 1, positive, negative, name, part)
 
                                 i = 0
                                 while i < 3:
@@ -487,129 +616,174 @@ class EPDDL_Parser:
 
 
     #-----------------------------------------------
-    # Print EFP
+    # Library API
     #-----------------------------------------------
-    def print_EFP(self):
-        #########File NAME
-        output_folder = "out/efp"
-        Path(output_folder).mkdir(exist_ok=True)
-
-
 
+    # parser = EPDDL_Parser()
+    # parser.parse_domain_text(domain_text)
+    # parser.parse_problem_text(problem_text)
+    # efp_text = parser.to_efp()
+    # pdkb_domain_text, pdkb_problem_text = parser.to_pdkb()
+
+    def copy_domain(self):
+        # A parser for another problem of the same domain. The parsed domain
+        # (types, predicates, actions and their compiled templates) is shared,
+        # only the objects (the constants, extended by each problem) are copied
+        parser = copy.copy(self)
+        parser.objects = self.copy_domain_objects()
+        return parser
+
+    def copy_domain_objects(self):
+        # The constants of the domain, that each problem extends with its objects
+        objects = {}
+        for obj_type in self.domain_objects:
+            objects[obj_type] = list(self.domain_objects[obj_type])
+        return objects
+
+    def to_efp(self, prune_static = False, jobs = 1, relevant = False, canonical = False):
+        # Returns the mAp conversion as a string, without using the filesystem
+        out = io.StringIO()
+        self.print_EFP(prune_static, jobs, out, spool = False, relevant = relevant, canonical = canonical)
+        return out.getvalue()
+
+    def to_pdkb(self):
+        # Returns the PDKB-PDDL domain and problem as a pair of strings
+        domain_out = io.StringIO()
+        problem_out = io.StringIO()
+        self.print_PDKB(domain_out, problem_out)
+        return domain_out.getvalue(), problem_out.getvalue()
 
-        file_name = self.domain_name + '_' + self.problem_name
-        out = open(output_folder + "/" + file_name+".txt", "w")
-        out.write("%This file is automatically generated from an E-PDDL specification and follows the mAp syntax.\n\n")
+    #-----------------------------------------------
+    # Print EFP
+    #-----------------------------------------------
+    def print_EFP(self, prune_static = False, jobs = 1, sink = None, compression = None, spool = True, relevant = False, canonical = False, digest = False, cache_folder = None):
+        # Writes to the file-like sink if given (e.g. sys.stdout or an io.StringIO),
+        # otherwise to out/efp/<domain>_<problem>.txt (compressed with gzip or xz if asked).
+        # With spool = False the ground actions are kept in memory instead of temporary files.
+        # With relevant = True only the fluents mentioned by the ground actions,
+        # :init and :goal are declared, instead of all the ground predicates.
+        # With canonical = True the initial state and the goals are sorted, so that
+        # the output does not depend on their order in the problem.
+        # With digest = True the SHA-256 of the output is returned (and written
+        # next to the output file as <file>.sha256).
+        # With a cache_folder the grounded actions are kept there and reused by
+        # the next conversions of problems with the same domain and objects
+        output_folder = None
+        if sink is None:
+            #########File NAME
+            output_folder = "out/efp"
+            Path(output_folder).mkdir(exist_ok=True)
+            file_name = self.domain_name + '_' + self.problem_name
+            out = OutputWriter.open(output_folder + "/" + file_name+".txt", compression, digest)
+        else:
+            out = OutputWriter(sink, digest = digest)
 
+        # The ground actions are written to spool files (kept next to the output)
+        # and the sections are assembled from them, so that no more than one
+        # ground action at a time is kept in memory
+        try:
+            with out, profiler.phase('print_EFP'):
+                out.write("%This file is automatically generated from an E-PDDL specification and follows the mAp syntax.\n\n")
+                if spool:
+                    with tempfile.TemporaryDirectory(dir = output_folder) as spool_folder:
+                        self.write_EFP(out, spool_folder, prune_static, jobs, relevant, canonical, cache_folder)
+                else:
+                    self.write_EFP(out, None, prune_static, jobs, relevant, canonical, cache_folder)
+        finally:
+            # The fluents interned by the conversion are not needed after it
+            # (the parser keeps the ones of :init and :goal)
+            Fluent.table.clear()
+        return out.hexdigest()
+
+    def write_EFP(self, out, spool_folder, prune_static = False, jobs = 1, relevant = False, canonical = False, cache_folder = None):
         #Generate grounded actions and add grounded fluents
-        fluents = set()
-        ground_actions = []
-        for action in parser.actions:
-            for act in action.groundify(parser.objects, parser.types,  self.requirements, fluents):
-                act_name = act.name
-                for parameter in act.parameters:
-                    act_name += '_'+parameter
-                act.name = act_name
-                ground_actions.append(act)
+        with profiler.phase('grounding'):
+            grounded, fluents = self.grounding_EFP(spool_folder, prune_static, jobs, relevant, cache_folder)
         #########FLuents
-        self.generate_fluents_EFP(fluents)
+        with profiler.phase('problem_fluents'):
+            if relevant:
+                self.problem_fluents_EFP(fluents)
+            else:
+                self.init_goal_fluents_EFP(fluents)
         if '' in fluents:
             fluents.remove('')
+        profiler.count('ground_actions', sum(count for names_spool, specifications_spool, count, ground_fluents in grounded))
+        profiler.count('fluents', len(fluents))
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%    FLUENTS    %%%%%%%%%%%%%%%%%%%%%%%%\n')
-        out.write('%Fluents generated from EPDDL by grounding each predicate (and cheking in :init, :goal and actions for extra predicates)\n')
+        if relevant:
+            out.write('%Fluents mentioned in the grounded actions, in :init and in :goal\n')
+        else:
+            out.write('%Fluents generated from EPDDL by grounding each predicate (and cheking in :init, :goal and actions for extra predicates)\n')
         out.write('%The fluents are lexicographically sorted and printed in sets of 10\n\n')
-        out.write('fluent ')
-        fl_count = 0
-        for fluent in sorted(fluents):
-            out.write(str(fluent))
-            if (fl_count != len(fluents)-1):
-                if((fl_count+1)%10 == 0):
-                    out.write(';\nfluent ')
-                else:
-                    out.write(', ')
-                fl_count +=1
-
-        out.write(';\n\n')
+        sorted_fluents = sorted(fluents)
+        out.write_sets('fluent', sorted_fluents)
+        out.write('\n\n')
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n\n\n')
+        out.checkpoint()
+        profiler.section('efp_fluents', out)
 
         #########Actions Names
         out.write('%%%%%%%%%%%%%%%%%%%%%    ACTIONS\' NAMES    %%%%%%%%%%%%%%%%%%%%%\n')
         out.write('%Actions\' names generated from EPDDL by adding to each action names its grounded predicates\n\n')
-        out.write('action ')
-        act_count = 0
-        for action in ground_actions:
-            out.write(action.name)
-            if (act_count != len(ground_actions)-1):
-                if((act_count+1)%10 == 0):
-                    out.write(';\naction ')
-                else:
-                    out.write(', ')
-                act_count +=1
-        out.write(';\n\n')
+        out.write_sets('action', self.read_names_EFP(grounded))
+        out.write('\n\n')
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n\n\n')
+        out.checkpoint()
+        profiler.section('efp_action_names', out)
 
 
         out.write('%%%%%%%%%%%%%%%%%%%%%    AGENTS\' NAMES    %%%%%%%%%%%%%%%%%%%%%%\n')
         out.write('%Agents\' names generated from EPDDL by looking at the \'agent\' predicate\n\n')
-        out.write('agent ')
-        ag_count = 0
-        for agent in self.objects['agent']:
-            out.write(agent)
-            if (ag_count != len(self.objects['agent'])-1):
-                if((ag_count+1)%10 == 0):
-                    out.write(';\nagent ')
-                else:
-                    out.write(', ')
-                ag_count +=1
-        out.write(';\n\n')
+        out.write_sets('agent', self.objects['agent'])
+        out.write('\n\n')
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n\n\n')
+        out.checkpoint()
+        profiler.section('efp_agents', out)
 
 
         #########Actions Specifications
         out.write('%%%%%%%%%%%%%%%%%    ACTIONS\' SPECIFICATIONS    %%%%%%%%%%%%%%%%\n')
         out.write('%Actions\' specifications generated from EPDDL by grounding each action\'s definition\n\n')
-        for action in ground_actions:
-            out.write('%%%Action ' + action.name + '\n\n')
-            out.write('executable ' + action.name)
-            self.print_precondition_EFP(action, out)
-            self.print_effects_EFP(action, out)
-            self.print_observers_EFP(action, 1, out)
-            self.print_observers_EFP(action, 0, out)
-            out.write('\n%%%\n\n')
+        for names_spool, specifications_spool, count, ground_fluents in grounded:
+            self.copy_specifications_EFP(specifications_spool, out)
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n\n\n')
+        out.checkpoint()
+        profiler.section('efp_action_specifications', out)
 
         #########Actions Specifications
         out.write('%%%%%%%%%%%%%%%%%%    INITIAL FLUENTS TRUTH   %%%%%%%%%%%%%%%%%%\n')
         out.write('%Fluents are considered true when are inserted in :init; otherwise are considered false\n\n')
         out.write('%%%True fluents\n')
         out.write('initially ')
-        ini_count = 0
+        true_ini = []
         true_fluents = set()
-        belief_ini= set()
-        temp_ini = list(self.state)
-        for index, ini_f in enumerate(temp_ini):
+        # A dict keeps the beliefs in the order of :init (a set would depend on the hash seed)
+        belief_ini = {}
+        for ini_f in self.state:
             ini_fs = self.unify_fluent_EFP(ini_f)
             if 'B(' in ini_fs or 'C(' in ini_fs:
-                belief_ini.add(ini_fs)
+                belief_ini[ini_fs] = None
             else:
-                out.write(ini_fs)
+                true_ini.append(ini_fs)
                 true_fluents.add(ini_fs)
-                if ( (index+1 < len(temp_ini)) and ('B(' not in temp_ini[index+1][0]  and 'C(' not in temp_ini[index+1][0])):
-                    out.write(', ')
+        if canonical:
+            # The fluents are already sorted: filtering them costs no comparison of strings
+            true_ini = [fluent for fluent in sorted_fluents if fluent in true_fluents]
+            belief_ini = sorted(belief_ini)
+        out.write(', '.join(true_ini))
         out.write(';\n')
-        neg_fluents = fluents - true_fluents
+        # Taken from the sorted fluents so that the order does not depend on how the set was built
+        neg_fluents = [fluent for fluent in sorted_fluents if fluent not in true_fluents]
 
         out.write('%%%False fluents\n')
         out.write('initially ')
-        ini_count = 0
-        for ini_f in neg_fluents:
-            out.write('-'+ini_f)
-            if (ini_count != len(neg_fluents)-1):
-                out.write(', ')
-                ini_count+=1
+        if neg_fluents:
+            out.write('-' + ', -'.join(neg_fluents))
         out.write(';\n')
         out.write('\n')
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n\n\n')
+        out.checkpoint()
+        profiler.section('efp_initial_fluents', out)
 
 
         out.write('%%%%%%%%%%%%%%%%%%    INITIAL BELIEFS TRUTH   %%%%%%%%%%%%%%%%%%\n')
@@ -624,27 +798,285 @@ class EPDDL_Parser:
         out.write(';\n')
         out.write('\n')
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n\n\n')
+        out.checkpoint()
+        profiler.section('efp_initial_beliefs', out)
 
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%%    GOALS   %%%%%%%%%%%%%%%%%%%%%%%%%%\n')
         out.write('%The goals of the plan. Each goal is presented separately to ease the reading\n\n')
-        for goal_f in self.positive_goals:
-            out.write('goal ')
-            goal_fs = self.unify_fluent_EFP(goal_f)
-            out.write(goal_fs + ';\n')
-
-        for goal_f in self.negative_goals:
-            out.write('goal ')
-            goal_fs = self.unify_fluent_EFP(goal_f)
-            out.write(goal_fs + ';\n')
+        for goals in (self.positive_goals, self.negative_goals):
+            goals = [self.unify_fluent_EFP(goal_f) for goal_f in goals]
+            if canonical:
+                goals.sort()
+            for goal_fs in goals:
+                out.write('goal ')
+                out.write(goal_fs + ';\n')
 
         out.write('\n')
         out.write('%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n')
-        out.close()
+        profiler.section('efp_goals', out)
 
     def unify_fluent_EFP(self,given_list):
         return Action.unify_fluent_EFP(given_list)
 
+    #-----------------------------------------------
+    # Ground actions
+    #-----------------------------------------------
+
+    def grounding_EFP(self, spool_folder, prune_static = False, jobs = 1, relevant = False, cache_folder = None):
+        # Returns the grounded actions (as ground_actions_EFP) and the fluents
+        # that do not depend on :init and :goal: the ones of the actions and,
+        # unless relevant, all the ground predicates
+        if cache_folder is not None:
+            key = self.grounding_key(prune_static, relevant)
+            cached = self.load_grounding(cache_folder, key)
+            if cached is not None:
+                return cached
+        fluents = set()
+        with profiler.phase('ground_actions'):
+            grounded = self.ground_actions_EFP(spool_folder, prune_static, jobs, relevant)
+        for names_spool, specifications_spool, count, ground_fluents in grounded:
+            fluents |= ground_fluents
+        if not relevant:
+            with profiler.phase('ground_predicates'):
+                self.ground_predicates_EFP(fluents)
+        if cache_folder is not None:
+            self.save_grounding(cache_folder, key, grounded, fluents)
+        return grounded, fluents
+
+    def ground_actions_EFP(self, spool_folder, prune_static = False, jobs = 1, relevant = False):
+        # Returns a (names spool, specifications spool, number of actions, fluents)
+        # tuple for each grounding task, in the order of self.actions; with
+        # jobs > 1 the tasks are run in a pool of worker processes.
+        # With relevant = True the fluents include all the ones the actions mention
+        static_facts = None
+        if prune_static:
+            static_facts = self.static_facts()
+        if jobs < 1:
+            jobs = os.cpu_count()
+        tasks = self.grounding_tasks(jobs)
+        if jobs == 1 or len(tasks) == 1:
+            return [self.ground_action_EFP(spool_folder, task, static_facts, relevant) for task in tasks]
+        with ProcessPoolExecutor(jobs, initializer = init_worker, initargs = (self, spool_folder, static_facts, relevant)) as pool:
+            return list(pool.map(ground_action_EFP_worker, tasks))
+
+    def grounding_tasks(self, jobs):
+        # Each task is a (task number, action index, slice of the first parameter's objects) triple.
+        # With more jobs, the actions are split so that the workers stay busy
+        # also when a few actions produce most of the ground actions
+        tasks = []
+        for index, action in enumerate(self.actions):
+            if jobs == 1 or not action.parameters:
+                tasks.append((len(tasks), index, None))
+                continue
+            first_objects = len(self.type_index.objects_of(action.parameters[0][1]))
+            parts = max(1, min(jobs, first_objects))
+            for part in range(parts):
+                tasks.append((len(tasks), index, slice(part * first_objects // parts, (part + 1) * first_objects // parts)))
+        return tasks
+
+    def ground_action_EFP(self, spool_folder, task, static_facts = None, relevant = False):
+        # Writes the names (one per line) and the specifications of the ground
+        # actions of a task to two spool files, one action at a time.
+        # Without a spool folder the ground actions are kept in a
+        # GroundActionStore, that is both the names and the specifications spool
+        number, index, first_slice = task
+        fluents = set()
+        seen = set()
+        count = 0
+        ground_actions = self.actions[index].groundify(self.objects, self.types, self.requirements, fluents, static_facts, first_slice, self.type_index)
+        if spool_folder is None:
+            store = GroundActionStore(index)
+            for act in ground_actions:
+                store.add(act)
+                if relevant:
+                    self.action_fluents_EFP(act, fluents, seen)
+                count += 1
+            store.seal()
+            return store, store, count, fluents
+        names_spool = os.path.join(spool_folder, 'task' + str(number) + '.names')
+        specifications_spool = os.path.join(spool_folder, 'task' + str(number) + '.specs')
+        template = None
+        with OutputWriter.open(names_spool) as names, OutputWriter.open(specifications_spool) as out:
+            for act in ground_actions:
+                act_name = act.name
+                for parameter in act.parameters:
+                    act_name += '_'+parameter
+                act.name = act_name
+                names.write(act_name + '\n')
+                if template is None:
+                    template = self.action_template_EFP(act)
+                self.print_action_EFP(act, out, template)
+                if relevant:
+                    self.action_fluents_EFP(act, fluents, seen)
+                count += 1
+        return names_spool, specifications_spool, count, fluents
+
+    def read_names_EFP(self, grounded):
+        for names_spool, specifications_spool, count, ground_fluents in grounded:
+            if type(names_spool) is GroundActionStore:
+                yield from names_spool.names(self.actions)
+                continue
+            with open(names_spool) as names:
+                for action_name in names:
+                    yield action_name[:-1]
+
+    def copy_names_EFP(self, names_spool, out):
+        if type(names_spool) is GroundActionStore:
+            for action_name in names_spool.names(self.actions):
+                out.write(action_name + '\n')
+            return
+        with open(names_spool) as names:
+            out.copy(names)
+
+    def copy_specifications_EFP(self, specifications_spool, out):
+        if type(specifications_spool) is GroundActionStore:
+            template = None
+            for action in specifications_spool.actions(self.actions):
+                if template is None:
+                    template = self.action_template_EFP(action)
+                self.print_action_EFP(action, out, template)
+            return
+        with open(specifications_spool) as specifications:
+            out.copy(specifications)
+
+    def print_action_EFP(self, action, out, template = None):
+        # template is the action_template_EFP of the ground actions of the same
+        # lifted action (they all have the same shape), made from action if not given
+        if template is None:
+            template = self.action_template_EFP(action)
+        width, specification = template
+        row = GroundActionStore.row_of(action)
+        if len(row) != width:
+            raise Exception('Ground action ' + action.name + ' does not have the shape of the other ground actions of its action')
+        out.write('%%%Action ' + action.name + '\n\nexecutable ' + action.name +
+            specification.format(action.name, *[fluent.to_EFP() if type(fluent) is Fluent else self.unify_fluent_EFP(fluent) for fluent in row]))
+        self.print_observers_EFP(action, 1, out)
+        self.print_observers_EFP(action, 0, out)
+        out.write('\n%%%\n\n')
+        out.checkpoint()
+
+    #-----------------------------------------------
+    # Grounding cache
+    #-----------------------------------------------
+
+    # Changing the grounding or the printing of the actions must change this version
+    GROUNDING_CACHE_VERSION = 1
+
+    def grounding_key(self, prune_static, relevant):
+        # The grounded actions depend only on the domain, the objects (agents
+        # included) and their types, the requirements and the options. With
+        # prune_static they also depend on the static facts of :init
+        static_facts = None
+        if prune_static:
+            static_facts = sorted((pred, sorted(facts)) for pred, facts in self.static_facts().items())
+        key = (self.GROUNDING_CACHE_VERSION, self.domain_hash, self.objects, self.types, self.requirements, relevant, static_facts)
+        return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+    def load_grounding(self, cache_folder, key):
+        path = os.path.join(cache_folder, key)
+        # The .json file is written last: if it exists, the entry is complete
+        try:
+            with open(path + '.json') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return [(path + '.names', path + '.specs', entry['count'], set())], set(entry['fluents'])
+
+    def save_grounding(self, cache_folder, key, grounded, fluents):
+        # Each file is written under a unique temporary name and renamed when
+        # complete (see OutputWriter.open), so concurrent conversions of the
+        # same entry never share a file and readers never see a partial one.
+        # The .json file is renamed last, after the .names and .specs files
+        path = os.path.join(cache_folder, key)
+        count = 0
+        try:
+            Path(cache_folder).mkdir(parents=True, exist_ok=True)
+            with OutputWriter.open(path + '.names') as names, OutputWriter.open(path + '.specs') as specifications:
+                for names_spool, specifications_spool, spool_count, ground_fluents in grounded:
+                    self.copy_names_EFP(names_spool, names)
+                    self.copy_specifications_EFP(specifications_spool, specifications)
+                    count += spool_count
+            with OutputWriter.open(path + '.json') as out:
+                out.write(json.dumps({'count': count, 'fluents': sorted(fluents)}))
+        except OSError:
+            # The cache is only an optimization: the conversion goes on without it
+            pass
+
+    #-----------------------------------------------
+    # Relevant fluents
+    #-----------------------------------------------
+
+    def action_fluents_EFP(self, action, fluents, seen):
+        # Adds to fluents every atom mentioned by a ground action: in its
+        # preconditions, in its effects and their conditions and in the
+        # conditions of its observers (for each agent of a forall), also
+        # inside beliefs. Fluents already visited (they are interned) are in seen
+        formulas = action.positive_preconditions + action.negative_preconditions
+        for effect in action.add_effects + action.del_effects:
+            formulas += [effect[0]] + effect[1] + effect[2]
+        for ags in action.observers + action.p_observers:
+            if 'FASTART' not in ags[0][0]:
+                formulas += ags[1] + ags[2]
+                continue
+            # The conditions of a forall, already expanded for each agent
+            excluded = set(ags[3][0][:1]) if ags[3] else set()
+            for agent, conditions, agent_formulas in self.observer_template_EFP(ags):
+                if agent not in excluded:
+                    formulas += agent_formulas
+        for formula in formulas:
+            # The fields of an action without parameters are lists, not interned fluents
+            if type(formula) is not Fluent:
+                formula = Fluent.of(formula)
+            if formula not in seen:
+                seen.add(formula)
+                self.add_atoms_EFP(formula, fluents)
+
+    def add_atoms_EFP(self, formula, fluents):
+        # The atom of a (belief) formula, without its B(/C( prefixes and negation
+        # (a '-' before the predicate or, in a nested (not ...), a 'not' token)
+        atom = []
+        for elem in formula:
+            if type(elem) in (list, tuple):
+                self.add_atoms_EFP(elem, fluents)
+            elif 'B(' not in elem and 'C(' not in elem and elem != 'not':
+                atom.append(elem)
+        if atom:
+            if atom[0].startswith('-'):
+                atom[0] = atom[0][1:]
+            fluents.add(self.unify_fluent_EFP(atom))
+
+    def problem_fluents_EFP(self, fluents):
+        # Adds the atoms of :init (facts and beliefs) and of :goal
+        for formula in itertools.chain(self.state, self.positive_goals, self.negative_goals):
+            self.add_atoms_EFP(formula, fluents)
+
+    #-----------------------------------------------
+    # Static predicates
+    #-----------------------------------------------
+
+    def static_predicates(self):
+        # Predicates that no action changes: their truth is the one in :init
+        changed = set()
+        for action in self.actions:
+            for effect in action.add_effects + action.del_effects:
+                Action.predicate_names(effect[0], changed)
+        return set(self.predicates) - changed
+
+    def static_facts(self):
+        static = self.static_predicates()
+        facts = {}
+        for pred in static:
+            facts[pred] = set()
+        for ini_f in self.state:
+            if Action.is_plain_atom(ini_f) and ini_f[0] in static:
+                facts[ini_f[0]].add(tuple(ini_f[1:]))
+        return facts
+
     def generate_fluents_EFP(self, fluents_set):
+        self.init_goal_fluents_EFP(fluents_set)
+        self.ground_predicates_EFP(fluents_set)
+
+    def init_goal_fluents_EFP(self, fluents_set):
 
         for ini_f in self.state:
             fluent = self.unify_fluent_EFP(ini_f)
@@ -661,108 +1093,76 @@ class EPDDL_Parser:
             if 'B(' not in fluent and 'C(' not in fluent:
                 fluents_set.add(fluent)
 
+    def ground_predicates_EFP(self, fluents_set):
         #duplicates = True
         duplicates = False
         if ':no-duplicates' in self.requirements:
             duplicates = False
-        for predicate in self.predicates.items():
-            #print('original:' + str(predicate))
-            type_map = []
-            variables = []
-            pred_ini=[]
-            pred_ini.append(predicate[0])
-            for var in self.predicates[predicate[0]]:
-                type = self.predicates[predicate[0]][var]
-                #print ('Type: ' + str(type) + ' var: ' + var + ' predicate: ' + predicate[0])
-                pred_ini.append(var)
-                type_stack = [type]
-                items = []
-                while type_stack:
-                    t = type_stack.pop()
-                    if t in parser.objects:
-                        items += parser.objects[t]
-                    elif t in parser.types:
-                        type_stack += parser.types[t]
-                    else:
-                        raise Exception('Unrecognized type ' + t)
-                type_map.append(items)
-                variables.append(var)
-            for assignment in itertools.product(*type_map):
-                if (not duplicates and len(assignment) == len(set(assignment))) or duplicates:
-                    #pred = predicate
-                    pred = list(pred_ini)
-                    iv = 0
-                #    print(str(variables))
-                #    print(str(assignment))
-                    for v in variables:
-                        while v in pred:
-                            pred[pred.index(v)] = assignment[iv]
-                        iv += 1
-                    fluent = self.unify_fluent_EFP(pred)
-                    if 'B(' not in fluent and 'C(' not in fluent:
-                        fluents_set.add(fluent)
-
-    def print_precondition_EFP(self,action,out):
-        if (len(action.positive_preconditions)+len(action.negative_preconditions) > 0):
-            out.write(' if ' )
-            #+ str([list(i) for i in action.positive_preconditions]) +  str([list(i) for i in action.negative_preconditions]))
-            self.subprint_precondition_EFP(action, 1, out)
-            self.subprint_precondition_EFP(action, 0, out)
-            out.write(';\n')
-
-    def reorder_bf_list(self, list):
-        ret = []
-        for elem in list:
-            if 'B(' in elem[0]:
-                ret.insert(0,elem)
-            else:
-                ret.append(elem)
-        return ret
-
-    def subprint_precondition_EFP(self,action,is_postive,out):
-        positive_pre = True
-        if (is_postive == 1):
-            preconditions = action.positive_preconditions
-        else:
-            positive_pre = False
-            preconditions = action.negative_preconditions
-        count = 0
-        preconditions = self.reorder_bf_list(preconditions)
-        for i in preconditions:
-            fluent = self.unify_fluent_EFP(i)
-            if (positive_pre):
-                out.write(fluent)
-            else:
-                out.write('-'+ fluent + '')
-            if (count < len(preconditions)-1) or (positive_pre and len(action.negative_preconditions) > 0):
-                out.write(', ')
-                count +=1
+        for predicate in self.predicates:
+            type_map = [self.type_index.objects_of(type) for type in self.predicates[predicate].values()]
+            fluents_set.update(self.predicate_fluents_EFP(predicate, type_map, duplicates))
+
+    def predicate_fluents_EFP(self, predicate, type_map, duplicates):
+        # All the ground atoms of a predicate as mAp fluents (predicate_obj1_..._objk).
+        # They are built one argument at a time from the shared prefixes, so each
+        # fluent costs one concatenation; lifted predicates never contain beliefs.
+        # Without duplicates, the objects already used in a prefix are skipped
+        if not type_map:
+            return [predicate]
+        partial = [(predicate + '_', ())]
+        for objects in type_map[:-1]:
+            partial = [(prefix + obj + '_', used + (obj,)) for prefix, used in partial for obj in objects if duplicates or obj not in used]
+        last = type_map[-1]
+        if duplicates:
+            return [prefix + obj for prefix, used in partial for obj in last]
+        return [prefix + obj for prefix, used in partial for obj in last if obj not in used]
+
+    def action_template_EFP(self, action):
+        # The preconditions and the effects of the ground actions of a lifted
+        # action, as (width of their rows, format string): the fields are
+        # {0} for the name of the ground action and {n} for the mAp string of
+        # the fluent n - 1 of its GroundActionStore.row_of. Which fluents are
+        # beliefs only depends on the lifted action, so the order of the
+        # fluents and the separators are worked out once, and each ground
+        # action is a single format
+        row = GroundActionStore.row_of(action)
+        slot = 1
+
+        pre_slots = []
+        for preconditions, sign in ((action.positive_preconditions, ''), (action.negative_preconditions, '-')):
+            pre_slots += [sign + '{' + str(slot + i) + '}' for i in self.reorder_bf_positions(range(len(preconditions)), preconditions)]
+            slot += len(preconditions)
+        specification = ''
+        if pre_slots:
+            specification += ' if ' + ', '.join(pre_slots) + ';\n'
 
-    def print_effects_EFP(self,action,out):
         if (action.act_type == 'sensing'):
             act_type = ' determines '
         elif (action.act_type == 'announcement'):
             act_type = ' announces '
         else:
             act_type = ' causes '
+        for effects, sign in ((action.add_effects, ''), (action.del_effects, '-')):
+            for effect in effects:
+                specification += '{0}' + act_type + sign + '{' + str(slot) + '}'
+                slot += 1
+                condition_slots = []
+                for conditions, condition_sign in ((effect[1], ''), (effect[2], '-')):
+                    condition_slots += [condition_sign + '{' + str(slot + i) + '}' for i in self.reorder_bf_positions(range(len(conditions)), conditions)]
+                    slot += len(conditions)
+                slot += len(effect[3])
+                if condition_slots:
+                    specification += ' if ' + ', '.join(condition_slots)
+                specification += ';\n'
+        return len(row), specification
 
-        if (len(action.add_effects) > 0):
-            for i in action.add_effects:
-                out.write(action.name + act_type)
-                fluent = self.unify_fluent_EFP(i[0])
-                out.write(fluent)
-                self.print_conditions_EFP(i[1],i[2],out)
-
-                out.write(';\n')
-
-        if (len(action.del_effects) > 0):
-            for i in action.del_effects:
-                out.write(action.name + act_type)
-                fluent = self.unify_fluent_EFP(i[0])
-                out.write('-'+ fluent + '')
-                self.print_conditions_EFP(i[1],i[2],out)
+    def reorder_bf_list(self, list):
+        # The beliefs (in reverse order) before the other fluents
+        return [elem for elem in reversed(list) if 'B(' in elem[0]] + [elem for elem in list if 'B(' not in elem[0]]
 
-                out.write(';\n')
+    def reorder_bf_positions(self, positions, fluents):
+        # reorder_bf_list of the fluents at positions, as positions
+        return [i for i in reversed(positions) if 'B(' in fluents[i][0]] + [i for i in positions if 'B(' not in fluents[i][0]]
 
     def print_observers_EFP(self,action,fully,out):
         if fully == 1:
@@ -776,50 +1176,42 @@ class EPDDL_Parser:
             for ags in observers:
                 for ag in ags[0]:
                     if 'FASTART' in ag:
-                        for agent in self.objects['agent']:
-                            notPrint = 0
-                            if ags[3][0][0] != '':
-                                if agent == ags[3][0][0]:
-                                    notPrint = 1
-                            if notPrint == 0:
-                                tmp_cond = [[]]
-                                self.copy_cond_list(ags,tmp_cond)
-
-                                out.write(agent + obs_type + action.name)
-                                self.substitute_ag(tmp_cond[1],agent)
-                                self.substitute_ag(tmp_cond[2],agent)
-
-                                self.print_conditions_EFP(tmp_cond[1],tmp_cond[2],out)
-                                out.write(';\n')
+                        # The agent excluded by diff (if any)
+                        excluded = set(ags[3][0][:1]) if ags[3] else set()
+                        for agent, conditions, agent_formulas in self.observer_template_EFP(ags):
+                            if agent not in excluded:
+                                out.write(agent + obs_type + action.name + conditions + ';\n')
                     else:
                         out.write(str(ag) + obs_type + action.name)
                         self.print_conditions_EFP(ags[1],ags[2],out)
                         out.write(';\n')
 
-    def copy_cond_list(self, agents, temp):
-        i = 0
-        while i < len(agents):
-            sub_temp = []
-            j = 0
-            while j < len(agents[i]):
-                if i > 0:
-                    k = 0
-                    sub_sub_temp = []
-                    while k < len(agents[i][j]):
-                        sub_sub_temp.insert(k,agents[i][j][k])
-                        k = k+1
-                else:
-                    sub_sub_temp = agents[i][j]
-                sub_temp.insert(j, sub_sub_temp)
-                j = j+1
-            temp.insert(i, sub_temp)
-            i = i+1
-
-    def substitute_ag(self, conds, agent):
-        for cond in conds:
-            for elem in cond:
-                if 'FASTART' in elem:
-                    conds[conds.index(cond)][cond.index(elem)] = re.sub(r'(FASTART\S+FASTOP)', agent ,elem)
+    def observer_template_EFP(self, ags):
+        # The (agent, printed conditions, conditions as fluents) of a forall
+        # observer, for each agent of the problem in order. The conditions of
+        # a forall are the same for many ground actions (they are interned
+        # fluents): each is expanded once, replacing the FASTART...FASTOP
+        # slots with the agent
+        try:
+            key = (tuple(ags[1]), tuple(ags[2]))
+            template = self.observer_templates.get(key)
+        except TypeError:
+            # The conditions of an action without parameters are lists
+            key = (Fluent.to_tuple(ags[1]), Fluent.to_tuple(ags[2]))
+            template = self.observer_templates.get(key)
+        if template is None:
+            template = []
+            for agent in self.objects['agent']:
+                positive = self.substitute_agent(ags[1], agent)
+                negative = self.substitute_agent(ags[2], agent)
+                conditions = io.StringIO()
+                self.print_conditions_EFP(positive, negative, conditions)
+                template.append((agent, conditions.getvalue(), [Fluent.of(condition) for condition in positive + negative]))
+            self.observer_templates[key] = template
+        return template
+
+    def substitute_agent(self, conditions, agent):
+        return [[re.sub(r'(FASTART\S+FASTOP)', agent, elem) if type(elem) is str and 'FASTART' in elem else elem for elem in condition] for condition in conditions]
 
     def print_conditions_EFP(self,pos_cond,neg_cond,out):
         yet_to_print = 1
@@ -829,14 +1221,6 @@ class EPDDL_Parser:
 
     def subprint_cond_EFP(self,conditions,isPos,out, yet_to_print):
         printed = 0
-        for condition in conditions:
-            if '' in condition:
-                condition.remove('')
-
-        for condition in conditions:
-            if not condition:
-                conditions.remove(condition)
-
         if conditions:
             count_cond = 0
             if (yet_to_print == 1):
@@ -859,15 +1243,36 @@ class EPDDL_Parser:
     #-----------------------------------------------
     # Print PDKB
     #-----------------------------------------------
-    def print_PDKB(self):
+    def print_PDKB(self, domain_sink = None, problem_sink = None, compression = None, digest = False):
+        # Writes to the file-like sinks if given, otherwise to out/pdkb/<domain>.pdkbpddl
+        # and out/pdkb/<problem>.pdkbpddl (compressed with gzip or xz if asked).
+        # With digest = True the SHA-256 of the two outputs are returned (and
+        # written next to the output files as <file>.sha256)
         #########File NAME
         output_folder = "out/pdkb"
-        Path(output_folder).mkdir(exist_ok=True)
-        self.print_domain_pdkb(output_folder)
-        self.print_problem_pdkb(output_folder)
-
-    def print_domain_pdkb(self, output_folder):
-        out = open(output_folder + "/" + self.domain_name+".pdkbpddl", "w")
+        if domain_sink is None or problem_sink is None:
+            Path(output_folder).mkdir(exist_ok=True)
+        if domain_sink is None:
+            domain_out = OutputWriter.open(output_folder + "/" + self.domain_name+".pdkbpddl", compression, digest)
+        else:
+            domain_out = OutputWriter(domain_sink, digest = digest)
+        try:
+            with domain_out, profiler.phase('print_PDKB_domain'):
+                self.print_domain_pdkb(domain_out)
+                profiler.section('pdkb_domain', domain_out)
+            if problem_sink is None:
+                problem_out = OutputWriter.open(output_folder + "/" + self.problem_name+".pdkbpddl", compression, digest)
+            else:
+                problem_out = OutputWriter(problem_sink, digest = digest)
+            with problem_out, profiler.phase('print_PDKB_problem'):
+                self.print_problem_pdkb(problem_out)
+                profiler.section('pdkb_problem', problem_out)
+        finally:
+            # As in print_EFP
+            Fluent.table.clear()
+        return domain_out.hexdigest(), problem_out.hexdigest()
+
+    def print_domain_pdkb(self, out):
         out.write(";This file is automatically generated from an E-PDDL specification and follows the PDKB-PDDL syntax.\n\n")
 
         out.write(';;;;;;;;;;;;;;;;;;;;    DOMAIN\'S FEATURES    ;;;;;;;;;;;;;;;;;;;\n\n')
@@ -907,7 +1312,7 @@ class EPDDL_Parser:
 
         out.write(';;;;;;;;;;;;;;;;;    ACTIONS\' SPECIFICATIONS    ;;;;;;;;;;;;;;;;\n\n')
 
-        for action in parser.actions:
+        for action in self.actions:
             out.write(';;;Action ' + action.name + '\n\n')
             out.write('\t(:action ' + action.name + '\n')
             self.print_parameters_PDKB(action, out)
@@ -919,12 +1324,12 @@ class EPDDL_Parser:
 
             #self.print_observers_EFP(action, 0, out)
             out.write('\t)\n;;;\n\n')
+            out.checkpoint()
         out.write(';;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;\n\n\n')
 
         out.write(')')
 
-    def print_problem_pdkb(self, output_folder):
-        out = open(output_folder + "/" + self.problem_name+".pdkbpddl", "w")
+    def print_problem_pdkb(self, out):
         out.write(";This file is automatically generated from an E-PDDL specification and follows the PDKB-PDDL syntax.\n\n")
         out.write('{include:'+self.domain_name+'.pdkbpddl}\n\n')
         out.write('(define (problem '+self.problem_name+')\n')
@@ -948,14 +1353,21 @@ class EPDDL_Parser:
         #init print
         out.write('\n\t(:init-type complete)')
         out.write('\n\t(:init')
-        t_depth = 1
-        while (t_depth <= int(self.depth)):
+        facts = self.init_facts_PDKB()
+        prefix = ''
+        beliefs = ''
+        for t_depth in range(1, int(self.depth) + 1):
             out.write("\n\n\t\t;Depth " + str(t_depth))
-            for ini_f in self.state:
-                ini_fs = self.unify_fluent_init_PDKB(ini_f,t_depth)
-                if ini_fs != '':
-                    out.write('\n\n' + ini_fs)
-            t_depth+=1
+            # The forall prefix and the beliefs of the agents of this depth
+            prefix += '\t\t(forall ?ag' + str(t_depth) + ' - agent\n' + '\t' * t_depth
+            beliefs = '[?ag' + str(t_depth) + ']' + beliefs
+            closing = ')' * t_depth
+            for kind, text in facts:
+                if kind == 'common':
+                    out.write('\n\n' + prefix + '\t\t' + beliefs + text + closing)
+                elif kind == 'repeated' or t_depth == 1:
+                    out.write('\n\n' + text)
+            out.checkpoint()
 
 
         out.write('\n\t)')
@@ -1010,7 +1422,10 @@ class EPDDL_Parser:
                             print("You should make use of the more explicit fields.")
                             print("**********************************\n")
 
-                        if len(ags[1]) == 1 and self.unify_fluent_PDKB(ags[1][0]) != '':
+                        if not ags[1] and not ags[2]:
+                            # Without a when the agents always observe
+                            out.write('always')
+                        elif len(ags[1]) == 1:
 
                             if ags[1] == ags[2]:
                                 out.write('always')
@@ -1198,14 +1613,6 @@ class EPDDL_Parser:
 
     def subprint_cond_PDKB(self,conditions,isPos,out, yet_to_print):
         printed = 0
-        for condition in conditions:
-            if '' in condition:
-                condition.remove('')
-
-        for condition in conditions:
-            if not condition:
-                conditions.remove(condition)
-
         if conditions:
             count_cond = 0
             if (yet_to_print == 1):
@@ -1223,78 +1630,124 @@ class EPDDL_Parser:
                     count_cond = count_cond +1
         return printed
 
-    def unify_fluent_init_PDKB(self,given_list, t_depth, no_change = False):
-        ret = ''
-        count = 1
-        found = False
-        to_reprint = False
-
-        if t_depth == 1:
-            to_reprint = True
-
-        new_list = copy.deepcopy(given_list)
-        for elem in given_list:
-            if 'C(' in elem:
-                if len(self.objects['agent']) == elem.count(','):
-                    to_reprint = True
-                    if not found:
-                        found = True
-                    else:
-                        return ('\t\t('+ self.unify_fluent_PDKB(given_list)+') ')
-
-                    del new_list[new_list.index(elem)]
-
-                    while count <= t_depth:
-                        ag_name = '?ag'+str(count)
-                        new_list.insert(0,'B('+ag_name+',')
-                        t_count = 0
-                        ret += ('\t\t(forall ' + ag_name + ' - agent\n')
-                        while t_count < count:
-                            ret += '\t'
-                            t_count += 1
-                        count += 1
-
-        if to_reprint:
-            ret+='\t\t'
-            if not found:
-                ret+= '('
-                count += 1
+    def init_facts_PDKB(self):
+        # Classifies each fact of :init once, as a (kind, text) pair:
+        #   - 'plain': printed only at depth 1, text is the whole line;
+        #   - 'common': a common knowledge of all the agents (a C(ag1,...,agn,)
+        #     token), printed at each depth d as the belief of d nested forall
+        #     agents: text is what follows their [?agd]...[?ag1] beliefs;
+        #   - 'repeated': with two such tokens, printed as it is at each depth.
+        agents = len(self.objects['agent'])
+        facts = []
+        for ini_f in self.state:
+            tokens = [position for position, elem in enumerate(ini_f) if type(elem) is str and 'C(' in elem and elem.count(',') == agents]
+            if not tokens:
+                facts.append(('plain', '\t\t(' + self.unify_fluent_PDKB(ini_f) + ')'))
+            elif len(tokens) > 1:
+                facts.append(('repeated', '\t\t(' + self.unify_fluent_PDKB(ini_f) + ') '))
+            else:
+                # The common knowledge becomes the belief of the forall agents:
+                # what follows the innermost one does not depend on the depth
+                rest = list(ini_f)
+                del rest[tokens[0]]
+                facts.append(('common', self.unify_fluent_PDKB(['B(?ag1,'] + rest)[len('[?ag1]'):]))
+        return facts
 
-            ret += self.unify_fluent_PDKB(new_list)
+    def unify_fluent_PDKB(self,given_list, no_change = False):
+        return Action.unify_fluent_PDKB(given_list, no_change, False)
 
-            while count > 1:
-                ret += ')'
-                count -= 1
-            #ret+='\n'
 
-        return ret
+#-----------------------------------------------
+# Workers
+#-----------------------------------------------
 
-    def unify_fluent_PDKB(self,given_list, no_change = False):
-        return Action.unify_fluent_PDKB(given_list, no_change, False)
+worker_parser = None
+worker_spool_folder = None
+worker_static_facts = None
+worker_relevant = False
+
+def init_worker(parser, spool_folder, static_facts, relevant):
+    global worker_parser, worker_spool_folder, worker_static_facts, worker_relevant
+    worker_parser = parser
+    worker_spool_folder = spool_folder
+    worker_static_facts = static_facts
+    worker_relevant = relevant
+
+def ground_action_EFP_worker(task):
+    return worker_parser.ground_action_EFP(worker_spool_folder, task, worker_static_facts, worker_relevant)
 
+def print_PDKB_worker(compression, digest, quiet):
+    # print_PDKB in a worker process, while the main one writes the mAp file.
+    # With quiet the warnings go to stderr (the mAp file is on stdout)
+    if quiet:
+        with contextlib.redirect_stdout(sys.stderr):
+            return worker_parser.print_PDKB(None, None, compression, digest)
+    return worker_parser.print_PDKB(None, None, compression, digest)
+
+# EPDDL_PROFILE=table|json profiles any program using the parser
+profiler.enable_from_environment()
 
 #-----------------------------------------------
 # Main
 #-----------------------------------------------
 if __name__ == '__main__':
-    import sys, pprint
-    domain = sys.argv[1]
-    problem = sys.argv[2]
+    import argparse
+    arg_parser = argparse.ArgumentParser(description='Converts an E-PDDL domain and problem to mAp (EFP 2.0) and PDKB-PDDL.')
+    arg_parser.add_argument('domain', help='the E-PDDL domain file')
+    arg_parser.add_argument('problem', help='the E-PDDL problem file')
+    arg_parser.add_argument('--target', choices=TARGETS, default='all', help='the outputs to write (all, the default, writes both)')
+    arg_parser.add_argument('--prune-static', action='store_true', help='do not ground actions whose preconditions on static predicates (never changed by any action) are false in :init')
+    arg_parser.add_argument('--jobs', type=int, default=1, metavar='N', help='ground the actions with N worker processes (0 uses all the available cores); with more than one, PDKB-PDDL is written by another worker process at the same time as mAp')
+    arg_parser.add_argument('--relevant-fluents', action='store_true', help='declare only the fluents mentioned by the grounded actions, :init and :goal')
+    arg_parser.add_argument('--canonical', action='store_true', help='sort the initial state and the goals of the mAp file, so that it does not depend on their order in the problem')
+    arg_parser.add_argument('--hash', action='store_true', help='write the SHA-256 of each output next to it (<file>.sha256)')
+    arg_parser.add_argument('--cache-dir', metavar='DIR', help='keep the grounded mAp actions in DIR and reuse them for problems with the same domain, objects and agents')
+    arg_parser.add_argument('--parse-cache', metavar='DIR', help='keep a snapshot of the parsed domain in DIR and load it instead of parsing the same domain file again')
+    arg_parser.add_argument('--compress', choices=sorted(COMPRESSIONS), help='compress the output files')
+    arg_parser.add_argument('--stdout', action='store_true', help='write the mAp file to the standard output instead of out/efp')
+    arg_parser.add_argument('--profile', choices=profiler.FORMATS, help='print the time, memory and counts of each phase on stderr at exit, as a table or as JSON')
+    args = arg_parser.parse_args()
+    if args.profile is not None:
+        profiler.enable(args.profile)
+    domain = args.domain
+    problem = args.problem
     parser = EPDDL_Parser()
 #    print('----------------------------')
 #    pprint.pprint(parser.scan_tokens(domain))
 #    print('----------------------------')
 #    pprint.pprint(parser.scan_tokens(problem))
 #    print('----------------------------')
-    parser.parse_domain(domain)
+    parser.parse_domain(domain, args.parse_cache)
     parser.parse_problem(problem)
-    parser.print_EFP()
-    print("\nThe given files have been correctly converted to mAp.")
-    print("The resulting file, called \'" +parser.domain_name+"_"+parser.problem_name+".txt\', is in the \'out\efp\' folder.\n")
-
-    parser.print_PDKB()
-    print("\nThe given files have been correctly converted to PDKB-PDDL.")
-    print("The resulting files, called \'" +parser.domain_name+".pdkpddl\' and \'" +parser.problem_name+".pdkpddl\', are in the \'out\pdkb\' folder.\n")
+    efp = args.target in ('efp', 'all')
+    pdkb = args.target in ('pdkb', 'all')
+    pdkb_pool = None
+    if efp and pdkb and args.jobs != 1:
+        # The two outputs only read the parsed problem: PDKB-PDDL is written
+        # by a worker process (forked with the parser) while mAp is written here
+        pdkb_pool = ProcessPoolExecutor(1, initializer = init_worker, initargs = (parser, None, None, False))
+        pdkb_written = pdkb_pool.submit(print_PDKB_worker, args.compress, args.hash, args.stdout)
+    if efp:
+        if args.stdout:
+            parser.print_EFP(args.prune_static, args.jobs, sys.stdout, relevant = args.relevant_fluents, canonical = args.canonical, cache_folder = args.cache_dir)
+        else:
+            parser.print_EFP(args.prune_static, args.jobs, None, args.compress, relevant = args.relevant_fluents, canonical = args.canonical, digest = args.hash, cache_folder = args.cache_dir)
+            print("\nThe given files have been correctly converted to mAp.")
+            print("The resulting file, called \'" +parser.domain_name+"_"+parser.problem_name+".txt\', is in the \'out\efp\' folder.\n")
+
+    if pdkb:
+        if pdkb_pool is not None:
+            with pdkb_pool:
+                pdkb_written.result()
+        elif args.stdout:
+            # The conversion warnings must not end up in the mAp output
+            with contextlib.redirect_stdout(sys.stderr):
+                parser.print_PDKB(None, None, args.compress, args.hash)
+        else:
+            parser.print_PDKB(None, None, args.compress, args.hash)
+        if not args.stdout:
+            print("\nThe given files have been correctly converted to PDKB-PDDL.")
+            print("The resulting files, called \'" +parser.domain_name+".pdkpddl\' and \'" +parser.problem_name+".pdkpddl\', are in the \'out\pdkb\' folder.\n")
 #    print('State: ' + str(parser.state))
 #    for act in parser.actions:
 #        print(act)
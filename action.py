@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 # Four spaces as indentation [no tabs]
-import re
-
 import itertools
 
+import fluent
+from fluent import Fluent
+from type_index import TypeIndex
+
 class Action:
 
     #-----------------------------------------------
@@ -24,6 +26,7 @@ class Action:
         self.p_observers = p_observers
         self.derive_cond = derive_cond
         self.explicit_eff = explicit_eff
+        self.templates = None
 
     #-----------------------------------------------
     # to String
@@ -52,199 +55,205 @@ class Action:
     # Groundify
     #-----------------------------------------------
 
-    def groundify(self, objects, types, requirements, fluents):
+    def groundify(self, objects, types, requirements, fluents, static_facts = None, first_slice = None, type_index = None):
         duplicates = True
         if ':no-duplicates' in requirements:
             duplicates = False
         if not self.parameters:
             yield self
             return
-        type_map = []
-        variables = []
-        for var, type in self.parameters:
-            type_stack = [type]
-            items = []
-            while type_stack:
-                t = type_stack.pop()
-                if t in objects:
-                    items += objects[t]
-                elif t in types:
-                    type_stack += types[t]
-                else:
-                    raise Exception('Unrecognized type ' + t)
-            type_map.append(items)
-            variables.append(var)
-
-        for assignment in itertools.product(*type_map):
+        if type_index is None:
+            type_index = TypeIndex(objects, types)
+        type_map = self.parameter_objects(type_index)
+        variables = [var for var, type in self.parameters]
+        if first_slice is not None:
+            # Only the assignments whose first object is in the slice
+            type_map[0] = type_map[0][first_slice]
+
+        if self.templates is None:
+            self.compile_templates(variables)
+        positive_pre_t, negative_pre_t, add_t, del_t, obs_t, p_obs_t = self.templates
+
+        if static_facts is None:
+            assignments = itertools.product(*type_map)
+        else:
+            assignments = self.static_join(type_map, variables, static_facts, duplicates)
+        for assignment in assignments:
             if (not duplicates and len(assignment) == len(set(assignment))) or duplicates:
-                positive_preconditions = self.replace(self.positive_preconditions, variables, assignment, fluents, 1)
-                negative_preconditions = self.replace(self.negative_preconditions, variables, assignment, fluents, 1)
-                add_effects = self.pair_replace(self.add_effects, variables, assignment, fluents, 1)
-                del_effects = self.pair_replace(self.del_effects, variables, assignment, fluents, 1)
-                observers = self.pair_replace(self.observers, variables, assignment, fluents, 0)
-                p_observers = self.pair_replace(self.p_observers, variables, assignment, fluents, 0)
+                positive_preconditions = Action.fill_group(positive_pre_t, assignment, fluents)
+                negative_preconditions = Action.fill_group(negative_pre_t, assignment, fluents)
+                add_effects = Action.fill_pairs(add_t, assignment, fluents)
+                del_effects = Action.fill_pairs(del_t, assignment, fluents)
+                observers = Action.fill_pairs(obs_t, assignment, None)
+                p_observers = Action.fill_pairs(p_obs_t, assignment, None)
                 yield Action(self.name, self.act_type, assignment, positive_preconditions, negative_preconditions, add_effects, del_effects, observers, p_observers)
 
+    def parameter_objects(self, type_index):
+        return [type_index.objects_of(type) for var, type in self.parameters]
+
     #-----------------------------------------------
-    # Replace
+    # Static join
     #-----------------------------------------------
 
-    def replace(self, group, variables, assignment,fluents, to_print):
+    def static_join(self, type_map, variables, static_facts, duplicates):
+        # Yields, in the same order of itertools.product(*type_map), only the
+        # assignments that satisfy the preconditions on static predicates.
+        # Each check is tested as soon as its last variable is bound so that
+        # whole branches of the product are pruned.
+        checks = [[] for v in variables]
+        for preconditions, is_positive in ((self.positive_preconditions, True), (self.negative_preconditions, False)):
+            for pred in preconditions:
+                if not Action.is_plain_atom(pred) or pred[0] not in static_facts:
+                    continue
+                args = []
+                last = -1
+                for arg in pred[1:]:
+                    if arg in variables:
+                        args.append(variables.index(arg))
+                        last = max(last, args[-1])
+                    else:
+                        args.append(arg)
+                if last == -1:
+                    if (tuple(args) in static_facts[pred[0]]) != is_positive:
+                        return
+                else:
+                    checks[last].append((static_facts[pred[0]], is_positive, args))
+
+        assignment = [None] * len(type_map)
+
+        def extend(k):
+            for obj in type_map[k]:
+                if not duplicates and obj in assignment[:k]:
+                    continue
+                assignment[k] = obj
+                for facts, is_positive, args in checks[k]:
+                    if (tuple([assignment[a] if type(a) is int else a for a in args]) in facts) != is_positive:
+                        break
+                else:
+                    if k == len(type_map) - 1:
+                        yield tuple(assignment)
+                    else:
+                        yield from extend(k + 1)
+
+        yield from extend(0)
+
+    @staticmethod
+    def is_plain_atom(pred):
+        for elem in pred:
+            if not type(elem) is str or 'B(' in elem or 'C(' in elem:
+                return False
+        return len(pred) > 0 and not pred[0].startswith('-')
+
+    @staticmethod
+    def predicate_names(given_list, names):
+        # Adds to names the predicate of each atom in given_list,
+        # also of the ones nested inside beliefs
+        found = False
+        for elem in given_list:
+            if type(elem) is list:
+                Action.predicate_names(elem, names)
+            elif not found and 'B(' not in elem and 'C(' not in elem:
+                names.add(elem.lstrip('-'))
+                found = True
+
+    #-----------------------------------------------
+    # Templates
+    #-----------------------------------------------
+
+    def compile_templates(self, variables):
+        # Resolves once, against the action's parameters, where each variable
+        # occurs (also inside the agents of 'B(' and 'C(' tokens) so that
+        # grounding only has to fill the slots with the assigned objects
+        def pair_templates(group):
+            return [(Action.compile_pred(elem[0], variables), Action.compile_group(elem[1], variables), Action.compile_group(elem[2], variables), Action.compile_group(elem[3], variables)) for elem in group]
+
+        self.templates = (
+            Action.compile_group(self.positive_preconditions, variables),
+            Action.compile_group(self.negative_preconditions, variables),
+            pair_templates(self.add_effects),
+            pair_templates(self.del_effects),
+            pair_templates(self.observers),
+            pair_templates(self.p_observers))
+
+    @staticmethod
+    def compile_group(group, variables):
+        return [Action.compile_pred(pred, variables) for pred in group]
+
+    @staticmethod
+    def compile_pred(pred, variables):
+        # A template is a list of (kind, value) pairs where kind is:
+        #   0: a constant token
+        #   1: a variable, value is its index in the parameters
+        #   2: a 'B(' or 'C(' token with variables, value is a format string
+        #   3: a nested list, value is its template
+        # The plain flag tells if the filled atom is a physical fluent.
+        slots = []
+        plain = True
+        for elem in pred:
+            if type(elem) is list:
+                slots.append((3, Action.compile_pred(elem, variables)))
+                plain = False
+            elif 'B(' in elem or 'C(' in elem:
+                plain = False
+                prefix = elem[:2]
+                agents = elem[2:-1].split(',')
+                if any(ag in variables for ag in agents):
+                    fmt = [prefix.replace('{', '{{').replace('}', '}}')]
+                    for ag in agents:
+                        if ag in variables:
+                            fmt.append('{' + str(variables.index(ag)) + '}')
+                        else:
+                            fmt.append(ag.replace('{', '{{').replace('}', '}}'))
+                        fmt.append(',')
+                    slots.append((2, fmt[0] + ''.join(fmt[1:])))
+                else:
+                    slots.append((0, elem))
+            elif elem in variables:
+                slots.append((1, variables.index(elem)))
+            else:
+                slots.append((0, elem))
+        return (slots, plain)
+
+    @staticmethod
+    def fill(template, assignment):
+        pred = []
+        for kind, value in template[0]:
+            if kind == 0:
+                pred.append(value)
+            elif kind == 1:
+                pred.append(assignment[value])
+            elif kind == 2:
+                pred.append(value.format(*assignment))
+            else:
+                pred.append(Action.fill(value, assignment))
+        return tuple(pred)
+
+    @staticmethod
+    def fill_group(templates, assignment, fluents):
         g = []
-    #    print("Group: " + str(group))
-        for pred in group:
-            pred = list(pred)
-
-            fluent = ''
-            l=0
-            j=''
-            k=''
-
-            #for i in pred:
-            #    if 'C(' in i:
-            #        j = re.sub(r'C\((.+)\,', r'C([\1],',i)
-            #        pred[pred.index(i)] = j
-
-            for i in pred:
-                iv = 0
-                l = l+1
-                if 'B(' in i:
-                    j = re.sub(r'B\((.+)\,', r'\1',i)
-                    for t in variables:
-                        if t == j:
-                            pred[pred.index(i)] = 'B('+assignment[iv]+','
-                    if type(pred[l]) is list:
-                        tmp_list = self.replace([pred[l]],variables, assignment,fluents, to_print)
-                        pred[l] = tmp_list[0]
-                elif 'C(' in i:
-                    k = re.sub(r'C\((.+)\,', r'\1',i)
-                    for j in re.findall(r'[^,]+\,', k):
-                        j = j.replace(',', '')
-                        for t in variables:
-                            if t == j:
-                                tmp_str = pred[pred.index(i)]
-                                tmp_str = tmp_str.replace(t,assignment[iv])
-                                pred[pred.index(i)] = tmp_str
-                    if type(pred[l]) is list:
-                        tmp_list = self.replace([pred[l]],variables, assignment,fluents, to_print)
-                        pred[l] = tmp_list[0]
-                iv += 1
-
-            for i in pred:
-                iv = 0
-                if 'C(' in i:
-                    k = re.sub(r'C\((.+)\,', r'\1',i)
-                    for j in re.findall(r'[^,]+\,', k):
-                        j = j.replace(',', '')
-                        for t in variables:
-                            if t == j:
-                                pred[pred.index(i)] = 'C(['+assignment[iv]+'],'
-                iv += 1
-
-
-            iv = 0
-            for v in variables:
-                while v in pred:
-                    pred[pred.index(v)] = assignment[iv]
-                iv += 1
-            if to_print == 1:
-                fluent = Action.unify_fluent_EFP(pred)
-                if 'B(' not in fluent and 'C(' not in fluent and '-' not in fluent:
-                    fluents.add(fluent)
+        for template in templates:
+            pred = Fluent.intern(Action.fill(template, assignment))
+            if fluents is not None and template[1]:
+                efp = pred.to_EFP()
+                if '-' not in efp:
+                    fluents.add(efp)
             g.append(pred)
         return g
 
-    def pair_replace(self, group, variables, assignment,fluents, to_print):
+    @staticmethod
+    def fill_pairs(templates, assignment, fluents):
         g = []
-        for elem in group:
-            body = self.replace([elem[0]], variables, assignment, fluents, to_print)
-            positive_head = self.replace(elem[1], variables, assignment, fluents, to_print)
-            negative_head = self.replace(elem[2], variables, assignment, fluents, to_print)
-            diff = self.replace(elem[3], variables, assignment, fluents, to_print)
-            g.append((body[0],positive_head,negative_head,diff))
+        for body, positive_head, negative_head, diff in templates:
+            g.append((Action.fill_group([body], assignment, fluents)[0], Action.fill_group(positive_head, assignment, fluents), Action.fill_group(negative_head, assignment, fluents), Action.fill_group(diff, assignment, fluents)))
         return g
 
     @staticmethod
     def unify_fluent_EFP(given_list):
-        fluent = ''
-        l = 0
-        parCount = 0
-        while l < len(given_list):
-            i = given_list[l]
-            if 'C(' in i:
-                i = i.replace('C(','C([')
-                i = i[:-1]
-                i = i + '],'
-
-            if 'B(' in i or  'C(' in i:
-                parCount +=1
-                l += 1
-                fluent += i
-
-                if type(given_list[l]) is list:
-                    fluent += Action.unify_fluent_EFP(given_list[l])
-                    l += len(given_list[l])
-                #fluent += (str(i))
-
-            else:
-                fluent += (str(i))
-                if l != len(given_list) -1:
-                    fluent += '_'
-                l +=1
-
-        while parCount != 0:
-            fluent +=')'
-            parCount -=1
-        return fluent
+        return fluent.unify_fluent_EFP(given_list)
 
     @staticmethod
     def unify_fluent_PDKB(given_list, no_change, from_bf):
-        fluent = ''
-        l = 0
-        parCount = 0
-        while l < len(given_list):
-            i = given_list[l]
-            if '-' in i and no_change == False:
-                i = i.replace('-','!')
-
-            if 'C(' in i:
-                from_bf = True
-                i = i.replace('C(','[')
-                i = i[:-1]
-                l += 1
-                fluent += i + ']'
-
-                if type(given_list[l]) is list:
-                    fluent += Action.unify_fluent_PDKB(given_list[l], no_change,from_bf)
-                    l += len(given_list[l])
-
-            elif 'B(' in i:
-                from_bf = True
-                i = i.replace('B(','[')
-                i = i[:-1]
-                l += 1
-                fluent += i + ']'
-
-                if type(given_list[l]) is list:
-                    fluent += Action.unify_fluent_PDKB(given_list[l], no_change,from_bf)
-                    l += len(given_list[l])
-                #fluent += (str(i))
-
-            else:
-                if from_bf:
-                    fluent += '('
-                    parCount += 1
-                    from_bf= False
-                fluent += (str(i))
-                if l != len(given_list) -1:
-                    fluent += ' '
-                l +=1
-
-        while parCount != 0:
-            fluent +=')'
-            parCount -=1
-
-        return fluent
+        return fluent.unify_fluent_PDKB(given_list, no_change, from_bf)
 
 #-----------------------------------------------
 # Main
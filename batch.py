@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+# Converts many problems of the same domain in one invocation. The domain
+# is parsed once and the problems are converted by a pool of worker
+# processes, each starting from a copy of the parsed domain. The outputs
+# are the ones of EPDDL.py (out/efp and out/pdkb). At the end a summary
+# with the status and the time of each problem is printed.
+#
+# The problems are given as files, directories (all their .epddl files but
+# the domain), glob patterns (e.g. 'benchmarks/*/pb*.epddl') or manifests
+# (--manifest FILE, one path per line, relative to the manifest).
+#
+# Usage: python -B batch.py domain problems... [--manifest FILE] [--jobs N] [options]
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from EPDDL import EPDDL_Parser, TARGETS
+from writer import COMPRESSIONS, OutputWriter
+
+#-----------------------------------------------
+# Problems
+#-----------------------------------------------
+
+def expand_problems(domain, sources, manifests = ()):
+    # The problem files of the sources and manifests, in the given order
+    # (the files of a directory or a glob are sorted), without repetitions
+    # and without the domain itself
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths += sorted(glob.glob(os.path.join(source, '*.epddl')))
+        elif glob.has_magic(source):
+            found = sorted(glob.glob(source, recursive = True))
+            if not found:
+                raise Exception('No problem matches ' + source)
+            paths += found
+        else:
+            paths.append(source)
+    for manifest in manifests:
+        folder = os.path.dirname(manifest)
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    paths.append(os.path.join(folder, line))
+    domain = os.path.realpath(domain)
+    problems = []
+    seen = set()
+    for path in paths:
+        real_path = os.path.realpath(path)
+        if real_path != domain and real_path not in seen:
+            seen.add(real_path)
+            problems.append(path)
+    return problems
+
+#-----------------------------------------------
+# Conversion
+#-----------------------------------------------
+
+def convert(parser, problem, options):
+    # Converts one problem with a copy of the parsed domain. Returns
+    # (status, seconds, messages, PDKB domain text): the PDKB domain depends
+    # on the agents of the problem, so it is written once by the caller
+    # instead of by every worker
+    start = time.perf_counter()
+    messages = io.StringIO()
+    pdkb_domain = None
+    try:
+        # The parser's messages and warnings must not interleave with the ones of the other workers
+        with contextlib.redirect_stdout(messages):
+            problem_parser = parser.copy_domain()
+            problem_parser.parse_problem(problem)
+            if options.target in ('efp', 'all'):
+                problem_parser.print_EFP(options.prune_static, 1, None, options.compress, relevant = options.relevant_fluents, canonical = options.canonical, digest = options.hash, cache_folder = options.cache_dir)
+            if options.target in ('pdkb', 'all'):
+                domain_out = io.StringIO()
+                problem_parser.print_PDKB(domain_out, None, options.compress, options.hash)
+                pdkb_domain = (problem_parser.domain_name, domain_out.getvalue())
+        status = 'ok'
+    except Exception as e:
+        status = 'error: ' + str(e)
+    return status, time.perf_counter() - start, messages.getvalue(), pdkb_domain
+
+def convert_all(parser, problems, options):
+    # Yields the result of convert for each problem, in the given order
+    jobs = options.jobs
+    if jobs < 1:
+        jobs = os.cpu_count()
+    if jobs == 1 or len(problems) == 1:
+        for problem in problems:
+            yield convert(parser, problem, options)
+        return
+    with ProcessPoolExecutor(jobs, initializer = init_worker, initargs = (parser, options)) as pool:
+        yield from pool.map(convert_worker, problems)
+
+def write_pdkb_domain(pdkb_domain, options):
+    domain_name, text = pdkb_domain
+    output_folder = 'out/pdkb'
+    os.makedirs(output_folder, exist_ok = True)
+    with OutputWriter.open(output_folder + '/' + domain_name + '.pdkbpddl', options.compress, options.hash) as out:
+        out.write(text)
+
+#-----------------------------------------------
+# Summary
+#-----------------------------------------------
+
+def print_summary(problems, results, elapsed, out = sys.stdout):
+    width = max([len('problem')] + [len(problem) for problem in problems])
+    out.write('%-*s %10s  %s\n' % (width, 'problem', 'time (s)', 'status'))
+    failed = 0
+    total = 0.0
+    for problem, (status, seconds, messages, pdkb_domain) in zip(problems, results):
+        out.write('%-*s %10.3f  %s\n' % (width, problem, seconds, status))
+        total += seconds
+        if status != 'ok':
+            failed += 1
+    out.write('\n' + str(len(problems) - failed) + ' converted, ' + str(failed) + ' failed in %.3f s (%.3f s of conversion)\n' % (elapsed, total))
+    return failed
+
+#-----------------------------------------------
+# Workers
+#-----------------------------------------------
+
+worker_parser = None
+worker_options = None
+
+def init_worker(parser, options):
+    global worker_parser, worker_options
+    worker_parser = parser
+    worker_options = options
+
+def convert_worker(problem):
+    return convert(worker_parser, problem, worker_options)
+
+#-----------------------------------------------
+# Main
+#-----------------------------------------------
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Converts many E-PDDL problems of the same domain to mAp (EFP 2.0) and PDKB-PDDL, parsing the domain once.')
+    arg_parser.add_argument('domain', help='the E-PDDL domain file')
+    arg_parser.add_argument('problems', nargs='*', help='problem files, directories (their .epddl files) or glob patterns')
+    arg_parser.add_argument('--manifest', action='append', default=[], metavar='FILE', help='a file listing the problems, one per line (relative to the file)')
+    arg_parser.add_argument('--jobs', type=int, default=0, metavar='N', help='convert N problems at a time in worker processes (0, the default, uses all the available cores)')
+    arg_parser.add_argument('--target', choices=TARGETS, default='all', help='the outputs to write')
+    arg_parser.add_argument('--prune-static', action='store_true', help='do not ground actions whose preconditions on static predicates (never changed by any action) are false in :init')
+    arg_parser.add_argument('--relevant-fluents', action='store_true', help='declare only the fluents mentioned by the grounded actions, :init and :goal')
+    arg_parser.add_argument('--canonical', action='store_true', help='sort the initial state and the goals of the mAp files, so that they do not depend on their order in the problems')
+    arg_parser.add_argument('--hash', action='store_true', help='write the SHA-256 of each output next to it (<file>.sha256)')
+    arg_parser.add_argument('--cache-dir', metavar='DIR', help='keep the grounded mAp actions in DIR and reuse them for problems with the same domain, objects and agents')
+    arg_parser.add_argument('--parse-cache', metavar='DIR', help='keep a snapshot of the parsed domain in DIR and load it instead of parsing the same domain file again')
+    arg_parser.add_argument('--compress', choices=sorted(COMPRESSIONS), help='compress the output files')
+    args = arg_parser.parse_args()
+    problems = expand_problems(args.domain, args.problems, args.manifest)
+    if not problems:
+        arg_parser.error('no problems to convert')
+    start = time.perf_counter()
+    parser = EPDDL_Parser()
+    parser.parse_domain(args.domain, args.parse_cache)
+    os.makedirs('out', exist_ok = True)
+    results = []
+    pdkb_domain = None
+    printed = set()
+    for problem, result in zip(problems, convert_all(parser, problems, args)):
+        results.append(result)
+        # The warnings about the domain are the same for every problem: they are printed once
+        if result[2] and result[2] not in printed:
+            printed.add(result[2])
+            sys.stderr.write(''.join(problem + ': ' + line + '\n' for line in result[2].strip('\n').split('\n')))
+        if result[3] is not None:
+            pdkb_domain = result[3]
+    # As with one conversion after the other, the PDKB domain is the one of the last problem
+    if pdkb_domain is not None:
+        write_pdkb_domain(pdkb_domain, args)
+    failed = print_summary(problems, results, time.perf_counter() - start)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+# Measures EPDDL_Parser.parse_problem on a synthetic problem with many
+# objects and :init atoms (by default 10^5 objects and 10^6 atoms).
+# Parsing should take seconds and grow linearly with the file size.
+#
+# Usage: python -B benchmarks/bench_parse_problem.py [n_objects [n_init_atoms]]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from EPDDL import EPDDL_Parser
+
+DOMAIN = '''(define (domain big)
+  (:requirements :strips :negative-preconditions :typing :mep)
+  (:types item - object)
+  (:predicates (near ?i1 ?i2 - item) (holds ?ag - agent ?i - item))
+
+  (:action take
+    :act_type ontic
+    :parameters (?ag - agent ?i - item)
+    :precondition (and ([?ag](not (holds ?ag ?i))))
+    :effect (holds ?ag ?i)
+    :observers (?ag)
+  )
+)
+'''
+
+def write_problem(path, n_objects, n_init):
+    with open(path, 'w') as out:
+        out.write('(define (problem big_problem)\n  (:domain big)\n  (:agents a b c)\n')
+        out.write('  (:objects\n')
+        for i in range(n_objects):
+            out.write('    i' + str(i) + '\n')
+        out.write('    - item)\n')
+        out.write('  (:init\n')
+        for i in range(n_init):
+            out.write('    (near i' + str(i % n_objects) + ' i' + str((i * 7 + 1) % n_objects) + ')\n')
+        out.write('    ([a b c](not (holds a i0))))\n')
+        out.write('  (:goal ([a](holds a i0)))\n)\n')
+
+if __name__ == '__main__':
+    n_objects = 10 ** 5
+    n_init = 10 ** 6
+    if len(sys.argv) > 1:
+        n_objects = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        n_init = int(sys.argv[2])
+    with tempfile.TemporaryDirectory() as folder:
+        domain = os.path.join(folder, 'domain.epddl')
+        problem = os.path.join(folder, 'problem.epddl')
+        with open(domain, 'w') as out:
+            out.write(DOMAIN)
+        write_problem(problem, n_objects, n_init)
+        parser = EPDDL_Parser()
+        parser.parse_domain(domain)
+        start = time.perf_counter()
+        parser.parse_problem(problem)
+        elapsed = time.perf_counter() - start
+    print('objects: ' + str(len(parser.objects['item'])) + ', init atoms: ' + str(len(parser.state)))
+    print('parse_problem: %.3f s' % elapsed)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+# Times each phase of the conversion (scan_tokens, parse_domain,
+# parse_problem, groundify, print_EFP, print_PDKB) on problems made by
+# generator.py, and writes the results as JSON, to compare versions.
+# Each phase is run repeat times on a fresh parser and the best time is kept.
+#
+# Usage: python -B benchmarks/bench_phases.py [--output FILE] [--repeat N]
+#            [--sweep name=v1,v2,...] [name=value ...]
+# e.g. --sweep agents=2,4,8,16 objects=5 times the phases for 2, 4, 8 and
+# 16 agents with 5 objects (and the other parameters at their defaults).
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import generator
+from EPDDL import EPDDL_Parser
+from fluent import Fluent
+
+PHASES = ('scan_tokens', 'parse_domain', 'parse_problem', 'groundify', 'print_EFP', 'print_PDKB')
+
+def run_phases(domain, problem):
+    # The time of each phase on a fresh parser
+    times = {}
+    parser = EPDDL_Parser()
+    start = time.perf_counter()
+    parser.scan_tokens(domain)
+    parser.scan_tokens(problem)
+    times['scan_tokens'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parser.parse_domain(domain)
+    times['parse_domain'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parser.parse_problem(problem)
+    times['parse_problem'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fluents = set()
+    ground_actions = 0
+    for action in parser.actions:
+        for act in action.groundify(parser.objects, parser.types, parser.requirements, fluents, None, None, parser.type_index):
+            ground_actions += 1
+    times['groundify'] = time.perf_counter() - start
+    # Grounding alone is not a conversion: print_EFP starts from an empty table as it would
+    Fluent.table.clear()
+
+    start = time.perf_counter()
+    parser.print_EFP()
+    times['print_EFP'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parser.print_PDKB()
+    times['print_PDKB'] = time.perf_counter() - start
+    return times, ground_actions
+
+def measure(params, repeat, folder):
+    # The best time of each phase over repeat runs, with the sizes of the problem and of the outputs
+    domain, problem = generator.write(folder, params)
+    best = {}
+    for i in range(repeat):
+        times, ground_actions = run_phases(domain, problem)
+        for phase in PHASES:
+            best[phase] = min(best.get(phase, times[phase]), times[phase])
+    sizes = {'domain_bytes': os.path.getsize(domain), 'problem_bytes': os.path.getsize(problem),
+        'ground_actions': ground_actions}
+    for name in ('efp', 'pdkb'):
+        sizes[name + '_bytes'] = sum(os.path.getsize(os.path.join('out', name, f)) for f in os.listdir(os.path.join('out', name)))
+    return {'params': params, 'seconds': best, 'total_seconds': sum(best.values()), 'sizes': sizes}
+
+def version():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = ROOT, capture_output = True, text = True, check = True).stdout.strip()
+    except Exception:
+        return None
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Times the phases of the conversion on generated problems.')
+    arg_parser.add_argument('params', nargs='*', metavar='name=value', help='generator parameters: ' + ', '.join(generator.DEFAULTS))
+    arg_parser.add_argument('--sweep', metavar='name=v1,v2,...', help='run once for each value of a parameter')
+    arg_parser.add_argument('--repeat', type=int, default=3, metavar='N', help='runs of each phase (the best time is kept)')
+    arg_parser.add_argument('--output', metavar='FILE', help='write the results to FILE instead of the standard output')
+    args = arg_parser.parse_args()
+    changes = generator.parse_assignments(args.params)
+    configurations = [generator.parameters(**changes)]
+    if args.sweep is not None:
+        name, values = args.sweep.split('=', 1)
+        configurations = [generator.parameters(**dict(changes, **generator.parse_assignments([name + '=' + value]))) for value in values.split(',')]
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # The printers write to out/efp and out/pdkb in the working directory
+        os.chdir(folder)
+        os.mkdir('out')
+        try:
+            # The warnings of the printers must not end up in the JSON
+            with contextlib.redirect_stdout(sys.stderr):
+                for params in configurations:
+                    result = measure(params, args.repeat, os.path.join(folder, 'gen'))
+                    results.append(result)
+                    sys.stderr.write(' '.join(name + '=' + str(params[name]) for name in params) + ': ' +
+                        ', '.join(phase + ' %.3f' % result['seconds'][phase] for phase in PHASES) + '\n')
+        finally:
+            os.chdir(cwd)
+
+    report = {'version': version(), 'python': platform.python_version(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': args.repeat, 'results': results}
+    if args.output is None:
+        json.dump(report, sys.stdout, indent = 2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent = 2)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+# Measures EPDDL_Parser.scan_tokens on synthetic domains of growing size.
+# The time per MB should stay (roughly) constant if tokenizing is linear.
+#
+# Usage: python -B benchmarks/bench_scan_tokens.py [max_size_in_MB [belief_depth]]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from EPDDL import EPDDL_Parser
+
+SIZES = [10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2]
+
+def nested_belief(depth, atom):
+    # [a1]([a2]( ... ([ak](atom)) ... )) with a common-knowledge outer layer
+    formula = '(' + atom + ')'
+    for d in range(depth, 0, -1):
+        formula = '([?ag' + str(d) + '](' + formula + '))'
+    return '([?ag1 ?ag2 -agent](' + formula + '))'
+
+def action(index, depth):
+    return ('  (:action act' + str(index) + ' ; synthetic action\n'
+        '    :act_type ontic\n'
+        '    :parameters (?ag1 ?ag2 - agent ?o - object)\n'
+        '    :precondition (and ' + nested_belief(depth, 'has ?ag1 ?o') + ' ((looking ?ag2)) (has ?ag1 ?o))\n'
+        '    :effect (and (has ?ag2 ?o) (not (has ?ag1 ?o)))\n'
+        '    :observers (and (?ag1) (forall (diff(?ag3)(?ag1)) (when (looking ?ag3) (?ag3))))\n'
+        '  )\n')
+
+def write_domain(path, size, depth = 8):
+    with open(path, 'w') as out:
+        out.write('(define (domain synthetic)\n')
+        out.write('  (:requirements :strips :negative-preconditions :mep)\n')
+        out.write('  (:predicates (has ?ag - agent ?o - object) (looking ?ag - agent))\n')
+        written = 0
+        index = 0
+        while written < size:
+            chunk = action(index, depth)
+            out.write(chunk)
+            written += len(chunk)
+            index += 1
+        out.write(')\n')
+
+if __name__ == '__main__':
+    max_size = SIZES[-1]
+    depth = 8
+    if len(sys.argv) > 1:
+        max_size = float(sys.argv[1]) * 1024 ** 2
+    if len(sys.argv) > 2:
+        depth = int(sys.argv[2])
+    parser = EPDDL_Parser()
+    print('%12s %10s %12s' % ('size (KB)', 'time (s)', 'time/MB (s)'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in SIZES:
+            if size > max_size:
+                break
+            path = os.path.join(folder, 'domain.epddl')
+            write_domain(path, size, depth)
+            real_size = os.path.getsize(path)
+            start = time.perf_counter()
+            parser.scan_tokens(path)
+            elapsed = time.perf_counter() - start
+            print('%12d %10.3f %12.3f' % (real_size // 1024, elapsed, elapsed / (real_size / 1024 ** 2)))
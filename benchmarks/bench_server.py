@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+# Compares the throughput (problems per second) of the CLI, which starts a
+# new interpreter and parses the domain for each problem, with server.py,
+# which keeps the parsed domain in memory. The problems are copies of the
+# coin in the box pb1 with different names.
+#
+# Usage: python -B benchmarks/bench_server.py [n_problems]
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+EXAMPLE = os.path.join(ROOT, 'examples', 'coin_in_the_box')
+DOMAIN = os.path.join(EXAMPLE, 'coininthebox.epddl')
+
+def write_problems(folder, n_problems):
+    with open(os.path.join(EXAMPLE, 'pb1.epddl')) as f:
+        text = f.read()
+    problems = []
+    for i in range(n_problems):
+        path = os.path.join(folder, 'pb' + str(i) + '.epddl')
+        with open(path, 'w') as out:
+            out.write(text.replace('(problem pb1)', '(problem pb' + str(i) + ')'))
+        problems.append(path)
+    return problems
+
+def run_cli(folder, problems):
+    start = time.perf_counter()
+    for problem in problems:
+        subprocess.run([sys.executable, '-B', os.path.join(ROOT, 'EPDDL.py'), DOMAIN, problem],
+            cwd = folder, stdout = subprocess.DEVNULL, check = True)
+    return time.perf_counter() - start
+
+def run_server(folder, problems):
+    requests = ''
+    for problem in problems:
+        requests += json.dumps({'id': problem, 'domain_file': DOMAIN, 'problem_file': problem,
+            'output_folder': os.path.join(folder, 'server')}) + '\n'
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-B', os.path.join(ROOT, 'server.py')],
+        input = requests, capture_output = True, text = True, check = True)
+    elapsed = time.perf_counter() - start
+    for line in result.stdout.splitlines():
+        response = json.loads(line)
+        if not response['ok']:
+            raise Exception(response['error'])
+    return elapsed
+
+if __name__ == '__main__':
+    n_problems = 50
+    if len(sys.argv) > 1:
+        n_problems = int(sys.argv[1])
+    with tempfile.TemporaryDirectory() as folder:
+        problems = write_problems(folder, n_problems)
+        os.mkdir(os.path.join(folder, 'out'))
+        cli = run_cli(folder, problems)
+        server = run_server(folder, problems)
+        # Same files from both paths
+        for i in range(n_problems):
+            for cli_path, server_path in (('out/efp/coininthebox_pb' + str(i) + '.txt', 'server/coininthebox_pb' + str(i) + '.txt'),
+                    ('out/pdkb/pb' + str(i) + '.pdkbpddl', 'server/pb' + str(i) + '.pdkbpddl')):
+                with open(os.path.join(folder, cli_path)) as f, open(os.path.join(folder, server_path)) as g:
+                    if f.read() != g.read():
+                        raise Exception('Different output for ' + server_path)
+    print('%8s %10s %14s' % ('path', 'time (s)', 'problems/s'))
+    print('%8s %10.3f %14.1f' % ('cli', cli, n_problems / cli))
+    print('%8s %10.3f %14.1f' % ('server', server, n_problems / server))
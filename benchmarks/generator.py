@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+# Generates scaled E-PDDL domains and problems, modelled on coin in the
+# box, to measure how the converter scales. The parameters are:
+#   agents      number of agents
+#   objects     number of objects (of type item)
+#   arity       number of item parameters of the predicates and of the actions
+#   predicates  number of item predicates (p0, p1, ...)
+#   actions     number of actions (ontic and sensing, alternating)
+#   depth       belief nesting depth of the :init atoms (and :depth of the problem)
+#   observers   fraction (0 to 1) of the actions whose (partial) observers are
+#               given with forall/when instead of explicitly
+#   init        number of :init atoms (facts and beliefs)
+#   seed        seed of the random choices of :init and :goal
+# The same parameters always give the same files.
+#
+# Usage: python -B benchmarks/generator.py folder [name=value ...]
+# (e.g. agents=5 objects=20 arity=2 depth=3) writes folder/domain.epddl
+# and folder/problem.epddl.
+
+import os
+import random
+import sys
+
+DEFAULTS = {'agents': 3, 'objects': 10, 'arity': 2, 'predicates': 2, 'actions': 4,
+    'depth': 2, 'observers': 0.5, 'init': 100, 'seed': 0}
+
+def parameters(**changes):
+    # The defaults, updated with changes
+    for name in changes:
+        if name not in DEFAULTS:
+            raise Exception('Unknown generator parameter ' + name + '. Please select one of the following: ' + ', '.join(DEFAULTS))
+    params = dict(DEFAULTS)
+    params.update(changes)
+    return params
+
+def item_variables(arity):
+    return ' '.join('?x' + str(i) for i in range(1, arity + 1))
+
+def uses_forall(params, index):
+    # The first round(observers * actions) actions use forall/when
+    return index < round(params['observers'] * params['actions'])
+
+#-----------------------------------------------
+# Domain
+#-----------------------------------------------
+
+def generate_domain(params):
+    arity = params['arity']
+    variables = item_variables(arity)
+    text = '(define (domain gen)\n'
+    text += '  (:requirements :strips :negative-preconditions :typing :mep)\n'
+    text += '  (:types item - object)\n'
+    text += '  (:predicates (looking ?ag - agent)'
+    for p in range(params['predicates']):
+        text += ' (p' + str(p) + ' ' + variables + ' - item)'
+    text += ')\n'
+    for a in range(params['actions']):
+        predicate = '(p' + str(a % params['predicates']) + ' ' + variables + ')'
+        forall = '(forall (diff(?ag2)(?ag)) (when (looking ?ag2) (?ag2)))'
+        text += '\n  (:action act' + str(a) + '\n'
+        if a % 2 == 0:
+            text += '    :act_type ontic\n'
+            text += '    :parameters (?ag - agent ' + variables + ' - item)\n'
+            text += '    :precondition (and ([?ag](not ' + predicate + ')) (looking ?ag))\n'
+            text += '    :effect ' + predicate + '\n'
+            if uses_forall(params, a):
+                text += '    :observers (and ' + forall + ' (?ag))\n'
+            else:
+                text += '    :observers (?ag)\n'
+        else:
+            text += '    :act_type sensing\n'
+            text += '    :parameters (?ag - agent ' + variables + ' - item)\n'
+            text += '    :precondition (and ([?ag](looking ?ag)) (looking ?ag))\n'
+            text += '    :effect (when (looking ?ag) ' + predicate + ')\n'
+            text += '    :observers (?ag)\n'
+            if uses_forall(params, a):
+                text += '    :p_observers (and ' + forall + ')\n'
+        text += '  )\n'
+    text += ')\n'
+    return text
+
+#-----------------------------------------------
+# Problem
+#-----------------------------------------------
+
+def generate_problem(params):
+    rng = random.Random(params['seed'])
+    agents = ['a' + str(i) for i in range(params['agents'])]
+    objects = ['i' + str(i) for i in range(params['objects'])]
+
+    def atom():
+        if rng.random() < 0.2:
+            return '(looking ' + rng.choice(agents) + ')'
+        predicate = 'p' + str(rng.randrange(params['predicates']))
+        return '(' + predicate + ' ' + ' '.join(rng.choice(objects) for i in range(params['arity'])) + ')'
+
+    def belief(formula, depth):
+        # formula believed by a chain of depth agents, or common knowledge (depth 0)
+        if rng.random() < 0.5:
+            formula = '(not ' + formula + ')'
+        if depth == 0:
+            return '([' + ' '.join(agents) + ']' + formula + ')'
+        agent = None
+        for i in range(depth):
+            # Without ([a]([a] ...)), that adds nothing to ([a] ...)
+            agent = rng.choice([ag for ag in agents if ag != agent] or agents)
+            formula = '([' + agent + ']' + formula + ')'
+        return formula
+
+    init = []
+    seen = set()
+    while len(init) < params['init'] and len(seen) < 4 * params['init']:
+        kind = rng.random()
+        if kind < 0.3:
+            formula = atom()
+        elif kind < 0.5:
+            formula = belief(atom(), 0)
+        else:
+            formula = belief(atom(), rng.randint(1, params['depth']))
+        if formula not in seen:
+            init.append(formula)
+        seen.add(formula)
+
+    text = '(define (problem gen_pb)\n'
+    text += '  (:domain gen)\n'
+    text += '  (:agents ' + ' '.join(agents) + ')\n'
+    text += '  (:objects ' + ' '.join(objects) + ' - item)\n'
+    text += '  (:depth ' + str(params['depth']) + ')\n'
+    text += '  (:init ' + ' '.join(init) + ')\n'
+    text += '  (:goal ' + belief(atom(), params['depth']) + ')\n'
+    text += ')\n'
+    return text
+
+def write(folder, params):
+    # Writes folder/domain.epddl and folder/problem.epddl, returns their paths
+    os.makedirs(folder, exist_ok = True)
+    domain = os.path.join(folder, 'domain.epddl')
+    problem = os.path.join(folder, 'problem.epddl')
+    with open(domain, 'w') as out:
+        out.write(generate_domain(params))
+    with open(problem, 'w') as out:
+        out.write(generate_problem(params))
+    return domain, problem
+
+def parse_assignments(assignments):
+    # ['agents=5', 'observers=0.25'] -> {'agents': 5, 'observers': 0.25}
+    changes = {}
+    for assignment in assignments:
+        name, value = assignment.split('=', 1)
+        changes[name] = type(DEFAULTS.get(name, 0))(value)
+    return changes
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python -B benchmarks/generator.py folder [name=value ...]')
+        sys.exit(1)
+    print('\n'.join(write(sys.argv[1], parameters(**parse_assignments(sys.argv[2:])))))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+class Fluent:
+
+    # A grounded (belief) formula such as ('B(a,', 'has_key', 'a').
+    # Fluents are interned: the same formula is always the same object, so
+    # it can be shared by all the ground actions, by :init and by :goal and
+    # its mAp/PDKB strings are computed only once.
+    __slots__ = ('items', 'hash', 'efp', 'pdkb')
+
+    table = {}
+
+    #-----------------------------------------------
+    # Initialize
+    #-----------------------------------------------
+
+    def __init__(self, items):
+        self.items = items
+        self.hash = hash(items)
+        self.efp = None
+        self.pdkb = None
+
+    @staticmethod
+    def intern(items):
+        # items must be a (nested) tuple of strings
+        fluent = Fluent.table.get(items)
+        if fluent is None:
+            fluent = Fluent(items)
+            Fluent.table[items] = fluent
+        return fluent
+
+    @staticmethod
+    def of(given_list):
+        return Fluent.intern(Fluent.to_tuple(given_list))
+
+    @staticmethod
+    def to_tuple(given_list):
+        if type(given_list) is Fluent:
+            return given_list.items
+        return tuple([Fluent.to_tuple(elem) if type(elem) in (list, tuple) else elem for elem in given_list])
+
+    #-----------------------------------------------
+    # Strings
+    #-----------------------------------------------
+
+    def to_EFP(self):
+        if self.efp is None:
+            self.efp = unify_fluent_EFP(self.items)
+        return self.efp
+
+    def to_PDKB(self):
+        if self.pdkb is None:
+            self.pdkb = unify_fluent_PDKB(self.items, False, False)
+        return self.pdkb
+
+    def __str__(self):
+        return self.to_EFP()
+
+    def __repr__(self):
+        return 'Fluent(' + repr(self.items) + ')'
+
+    #-----------------------------------------------
+    # Sequence, equality and pickling
+    #-----------------------------------------------
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, elem):
+        return elem in self.items
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) is Fluent:
+            return self.hash == other.hash and self.items == other.items
+        return False
+
+    def __reduce__(self):
+        return (Fluent.intern, (self.items,))
+
+#-----------------------------------------------
+# mAp and PDKB strings
+#-----------------------------------------------
+
+def unify_fluent_EFP(given_list):
+    if type(given_list) is Fluent:
+        return given_list.to_EFP()
+    fluent = ''
+    l = 0
+    parCount = 0
+    while l < len(given_list):
+        i = given_list[l]
+        if 'C(' in i:
+            i = i.replace('C(','C([')
+            i = i[:-1]
+            i = i + '],'
+
+        if 'B(' in i or  'C(' in i:
+            parCount +=1
+            l += 1
+            fluent += i
+
+            if type(given_list[l]) in (list, tuple):
+                fluent += unify_fluent_EFP(given_list[l])
+                l += len(given_list[l])
+            #fluent += (str(i))
+
+        else:
+            fluent += (str(i))
+            if l != len(given_list) -1:
+                fluent += '_'
+            l +=1
+
+    while parCount != 0:
+        fluent +=')'
+        parCount -=1
+    return fluent
+
+def unify_fluent_PDKB(given_list, no_change, from_bf):
+    if type(given_list) is Fluent:
+        if not no_change and not from_bf:
+            return given_list.to_PDKB()
+        given_list = given_list.items
+    fluent = ''
+    l = 0
+    parCount = 0
+    while l < len(given_list):
+        i = given_list[l]
+        if '-' in i and no_change == False:
+            i = i.replace('-','!')
+
+        if 'C(' in i:
+            from_bf = True
+            i = i.replace('C(','[')
+            i = i[:-1]
+            l += 1
+            fluent += i + ']'
+
+            if type(given_list[l]) in (list, tuple):
+                fluent += unify_fluent_PDKB(given_list[l], no_change,from_bf)
+                l += len(given_list[l])
+
+        elif 'B(' in i:
+            from_bf = True
+            i = i.replace('B(','[')
+            i = i[:-1]
+            l += 1
+            fluent += i + ']'
+
+            if type(given_list[l]) in (list, tuple):
+                fluent += unify_fluent_PDKB(given_list[l], no_change,from_bf)
+                l += len(given_list[l])
+            #fluent += (str(i))
+
+        else:
+            if from_bf:
+                fluent += '('
+                parCount += 1
+                from_bf= False
+            fluent += (str(i))
+            if l != len(given_list) -1:
+                fluent += ' '
+            l +=1
+
+    while parCount != 0:
+        fluent +=')'
+        parCount -=1
+
+    return fluent
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+from array import array
+
+from action import Action
+from fluent import Fluent
+
+# The fields of a ground action that are lists of fluents
+GROUP_FIELDS = ('positive_preconditions', 'negative_preconditions')
+# The fields that are lists of (fluent, positive conditions, negative conditions, diff),
+# where the fluent is the effect or the observing agents
+PAIR_FIELDS = ('add_effects', 'del_effects', 'observers', 'p_observers')
+
+class GroundActionStore:
+
+    # The ground actions of a lifted action (of a grounding task), kept in
+    # memory without an Action object each. groundify fills the same
+    # templates for every assignment, so all the ground actions have the
+    # same shape (number of preconditions, of effects and of conditions of
+    # each effect and observer). The fluents (interned, so shared by all
+    # the actions) and the objects are numbered, and each ground action is
+    # a fixed-width row of fluent numbers in an array('i') and a row of
+    # object numbers (its parameters) in another one.
+    # A ground action is rebuilt from its rows only to be printed.
+
+    #-----------------------------------------------
+    # Initialize
+    #-----------------------------------------------
+
+    def __init__(self, index):
+        # index is the position of the lifted action in the parser's actions
+        self.index = index
+        self.shape = None
+        self.width = 0
+        self.arity = 0
+        self.count = 0
+        self.rows = array('i')
+        self.objects = array('i')
+        self.fluents = []
+        self.object_names = []
+        # Only needed while adding actions (see seal)
+        self.fluent_ids = {}
+        self.object_ids = {}
+
+    def __len__(self):
+        return self.count
+
+    #-----------------------------------------------
+    # Encode
+    #-----------------------------------------------
+
+    def fluent_id(self, fluent):
+        if type(fluent) is not Fluent:
+            # The fields of an action without parameters are lists, not interned fluents
+            fluent = Fluent.of(fluent)
+        number = self.fluent_ids.get(fluent)
+        if number is None:
+            number = len(self.fluents)
+            self.fluent_ids[fluent] = number
+            self.fluents.append(fluent)
+        return number
+
+    def object_id(self, obj):
+        number = self.object_ids.get(obj)
+        if number is None:
+            number = len(self.object_names)
+            self.object_ids[obj] = number
+            self.object_names.append(obj)
+        return number
+
+    @staticmethod
+    def shape_of(action):
+        # Where each field is in a row: (start, end) for a group field and,
+        # for a pair field, a (position of the fluent, (start, end) of each
+        # group of conditions) tuple for each pair
+        shape = []
+        position = 0
+        for name in GROUP_FIELDS:
+            length = len(getattr(action, name))
+            shape.append((position, position + length))
+            position += length
+        for name in PAIR_FIELDS:
+            pairs = []
+            for pair in getattr(action, name):
+                slots = [position]
+                position += 1
+                for group in pair[1:]:
+                    slots.append((position, position + len(group)))
+                    position += len(group)
+                pairs.append(tuple(slots))
+            shape.append(tuple(pairs))
+        return tuple(shape), position
+
+    @staticmethod
+    def row_of(action):
+        # The fluents of an action, in the order of shape_of
+        row = action.positive_preconditions + action.negative_preconditions
+        for name in PAIR_FIELDS:
+            for body, positive, negative, diff in getattr(action, name):
+                row.append(body)
+                row += positive
+                row += negative
+                row += diff
+        return row
+
+    def add(self, action):
+        if self.shape is None:
+            self.shape, self.width = GroundActionStore.shape_of(action)
+            self.arity = len(action.parameters)
+        row = GroundActionStore.row_of(action)
+        try:
+            row = [self.fluent_ids[fluent] for fluent in row]
+        except (KeyError, TypeError):
+            row = [self.fluent_id(fluent) for fluent in row]
+        if len(row) != self.width:
+            raise Exception('Ground action ' + action.name + ' does not have the shape of the other ground actions of its action')
+        self.rows.extend(row)
+        self.objects.extend([self.object_id(obj) for obj in action.parameters])
+        self.count += 1
+
+    def seal(self):
+        # Drops the numbering dicts: no more actions will be added
+        self.fluent_ids = None
+        self.object_ids = None
+
+    #-----------------------------------------------
+    # Decode
+    #-----------------------------------------------
+
+    def parameters(self, i):
+        return tuple([self.object_names[obj] for obj in self.objects[i * self.arity:(i + 1) * self.arity]])
+
+    def names(self, lifted_actions):
+        name = lifted_actions[self.index].name
+        for i in range(self.count):
+            yield name + ''.join(['_' + obj for obj in self.parameters(i)])
+
+    def actions(self, lifted_actions):
+        # The ground actions, as groundify made them (but named with their parameters)
+        if self.count == 0:
+            # Nothing was added (e.g. all pruned by static facts): there is no shape
+            return
+        lifted = lifted_actions[self.index]
+        fluents = self.fluents
+        group_slots = self.shape[:len(GROUP_FIELDS)]
+        pair_slots = self.shape[len(GROUP_FIELDS):]
+        for i in range(self.count):
+            row = [fluents[number] for number in self.rows[i * self.width:(i + 1) * self.width]]
+            fields = [row[start:end] for start, end in group_slots]
+            for pairs in pair_slots:
+                fields.append([(row[body], row[c1[0]:c1[1]], row[c2[0]:c2[1]], row[c3[0]:c3[1]]) for body, c1, c2, c3 in pairs])
+            parameters = self.parameters(i)
+            yield Action(lifted.name + ''.join(['_' + obj for obj in parameters]), lifted.act_type, parameters, *fields)
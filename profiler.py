@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+# Opt-in instrumentation of a conversion: wall and CPU time and peak memory
+# of each phase, counts (ground actions, fluents, unify_fluent_* calls) and
+# the bytes written to each section of the outputs.
+# It is enabled by EPDDL.py --profile table|json or, for any program using
+# the converter (batch.py, server.py, ...), by the environment variable
+# EPDDL_PROFILE=table|json; the report is printed on stderr at exit.
+# When it is disabled, phase returns a shared no-op context, count and
+# section return at once and the unify_fluent_* functions are not wrapped.
+# With worker processes (--jobs) only the work done by the main process is
+# counted.
+
+import atexit
+import contextlib
+import fluent
+import functools
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+FORMATS = ('table', 'json')
+
+class Profile:
+
+    #-----------------------------------------------
+    # Initialize
+    #-----------------------------------------------
+
+    def __init__(self):
+        # name -> {'wall', 'cpu', 'peak', 'calls', 'depth'}, in the order the phases started
+        self.phases = {}
+        self.counts = {}
+        # name -> bytes written
+        self.sections = {}
+        # id of a writer -> its bytes written at the last section
+        self.marks = {}
+        # The peaks of the running phases (each phase resets the peak of tracemalloc)
+        self.stack = []
+
+    #-----------------------------------------------
+    # Record
+    #-----------------------------------------------
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.stack:
+            self.stack[-1] = max(self.stack[-1], tracemalloc.get_traced_memory()[1])
+        record = self.phases.get(name)
+        if record is None:
+            record = {'wall': 0.0, 'cpu': 0.0, 'peak': 0, 'calls': 0, 'depth': len(self.stack)}
+            self.phases[name] = record
+        self.stack.append(0)
+        tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record['wall'] += time.perf_counter() - wall
+            record['cpu'] += time.process_time() - cpu
+            peak = max(self.stack.pop(), tracemalloc.get_traced_memory()[1])
+            record['peak'] = max(record['peak'], peak)
+            record['calls'] += 1
+            if self.stack:
+                self.stack[-1] = max(self.stack[-1], peak)
+
+    def count(self, name, n = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def section(self, name, out):
+        # The bytes written by out since its previous section (the outputs are ASCII)
+        out.flush()
+        self.sections[name] = self.sections.get(name, 0) + out.written - self.marks.get(id(out), 0)
+        self.marks[id(out)] = out.written
+
+    def counter(self, name, function):
+        # function, counting its calls
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return function(*args, **kwargs)
+        return counted
+
+    #-----------------------------------------------
+    # Report
+    #-----------------------------------------------
+
+    def to_dict(self):
+        phases = {}
+        for name, record in self.phases.items():
+            phases[name] = {'wall_seconds': record['wall'], 'cpu_seconds': record['cpu'],
+                'peak_traced_bytes': record['peak'], 'calls': record['calls']}
+        return {'phases': phases, 'counts': self.counts, 'section_bytes': self.sections,
+            'peak_traced_bytes': max([tracemalloc.get_traced_memory()[1]] + [record['peak'] for record in self.phases.values()]),
+            'max_rss_kilobytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+    def report(self, format, out):
+        if format == 'json':
+            json.dump(self.to_dict(), out, indent = 2)
+            out.write('\n')
+            return
+        out.write('%-32s %10s %10s %12s %6s\n' % ('phase', 'wall (s)', 'cpu (s)', 'peak (KiB)', 'calls'))
+        for name, record in self.phases.items():
+            out.write('%-32s %10.3f %10.3f %12d %6d\n' % ('  ' * record['depth'] + name, record['wall'], record['cpu'], record['peak'] // 1024, record['calls']))
+        if self.counts:
+            out.write('\n%-32s %12s\n' % ('count', 'value'))
+            for name, value in self.counts.items():
+                out.write('%-32s %12d\n' % (name, value))
+        if self.sections:
+            out.write('\n%-32s %12s\n' % ('section', 'bytes'))
+            for name, value in self.sections.items():
+                out.write('%-32s %12d\n' % (name, value))
+        out.write('\nmax RSS: %d KiB\n' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+#-----------------------------------------------
+# Module interface
+#-----------------------------------------------
+
+# The active profile, None when disabled
+profile = None
+no_phase = contextlib.nullcontext()
+
+def phase(name):
+    # with phase('parse_domain'): ...
+    if profile is None:
+        return no_phase
+    return profile.phase(name)
+
+def count(name, n = 1):
+    if profile is not None:
+        profile.count(name, n)
+
+def section(name, out):
+    if profile is not None:
+        profile.section(name, out)
+
+def enable(format = 'table', out = None):
+    # Starts profiling and prints the report (on stderr by default) at exit
+    global profile
+    if format not in FORMATS:
+        raise Exception('Unknown profile format ' + str(format) + '. Please select one of the following: ' + ', '.join(FORMATS))
+    if profile is not None:
+        return profile
+    profile = Profile()
+    tracemalloc.start()
+    # The unify functions are called from fluent.py through their module globals
+    for name in ('unify_fluent_EFP', 'unify_fluent_PDKB'):
+        setattr(fluent, name, profile.counter(name, getattr(fluent, name)))
+    atexit.register(lambda: profile.report(format, out or sys.stderr))
+    return profile
+
+def enable_from_environment():
+    format = os.environ.get('EPDDL_PROFILE')
+    if format:
+        enable(format)
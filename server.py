@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+# Long-running converter. It reads JSON requests, one per line, and writes
+# one JSON response per line, on stdin/stdout or on a Unix socket.
+# Parsed domains are kept in an LRU cache keyed by the hash of their text,
+# so that a request only parses its problem.
+#
+# Request:
+#   {"id": any, "domain": text | "domain_file": path, "problem": text | "problem_file": path,
+#    "target": "efp" | "pdkb" | "all" (default), "prune_static": bool, "relevant_fluents": bool,
+#    "canonical": bool, "hash": bool, "output_folder": path (optional)}
+# Response:
+#   {"id": any, "ok": true, "efp": text, "pdkb_domain": text, "pdkb_problem": text}
+#   {"id": any, "ok": false, "error": message}
+# With "hash" the response also has the SHA-256 of each output ("efp_sha256", ...).
+# With "output_folder" the outputs are written there (with the names used
+# by EPDDL.py) and the response has their paths instead of their text.
+#
+# Usage: python -B server.py [--socket PATH] [--cache-size N]
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import socketserver
+import sys
+
+from collections import OrderedDict
+
+from EPDDL import EPDDL_Parser, TARGETS
+
+class ConversionServer:
+
+    #-----------------------------------------------
+    # Initialize
+    #-----------------------------------------------
+
+    def __init__(self, cache_size = 16):
+        self.cache_size = cache_size
+        self.domains = OrderedDict()
+
+    #-----------------------------------------------
+    # Domain cache
+    #-----------------------------------------------
+
+    def domain_parser(self, text):
+        if type(text) is str:
+            text = text.encode('utf-8')
+        key = hashlib.sha256(text).hexdigest()
+        parser = self.domains.get(key)
+        if parser is None:
+            parser = EPDDL_Parser()
+            parser.parse_domain_text(text)
+            self.domains[key] = parser
+            if len(self.domains) > self.cache_size:
+                self.domains.popitem(last = False)
+        else:
+            self.domains.move_to_end(key)
+        return parser.copy_domain()
+
+    #-----------------------------------------------
+    # Requests
+    #-----------------------------------------------
+
+    def handle(self, request):
+        response = {'id': request.get('id')}
+        try:
+            # The parser's messages and warnings must not end up in the responses
+            with contextlib.redirect_stdout(sys.stderr):
+                response.update(self.convert(request))
+            response['ok'] = True
+        except Exception as e:
+            response['ok'] = False
+            response['error'] = str(e)
+        return response
+
+    def convert(self, request):
+        target = request.get('target', 'all')
+        if target not in TARGETS:
+            raise Exception('Unknown target ' + str(target) + '. Please select one of the following: ' + ', '.join(TARGETS))
+        parser = self.domain_parser(self.source(request, 'domain'))
+        parser.parse_problem_text(self.source(request, 'problem'))
+        result = {}
+        if target in ('efp', 'all'):
+            result['efp'] = parser.to_efp(request.get('prune_static', False), 1, request.get('relevant_fluents', False), request.get('canonical', False))
+        if target in ('pdkb', 'all'):
+            result['pdkb_domain'], result['pdkb_problem'] = parser.to_pdkb()
+        if request.get('hash', False):
+            for output in list(result):
+                result[output + '_sha256'] = hashlib.sha256(result[output].encode('utf-8')).hexdigest()
+        output_folder = request.get('output_folder')
+        if output_folder is not None:
+            names = {'efp': parser.domain_name + '_' + parser.problem_name + '.txt',
+                'pdkb_domain': parser.domain_name + '.pdkbpddl',
+                'pdkb_problem': parser.problem_name + '.pdkbpddl'}
+            os.makedirs(output_folder, exist_ok = True)
+            for output in names:
+                if output not in result:
+                    continue
+                path = os.path.join(output_folder, names[output])
+                with open(path, 'w') as out:
+                    out.write(result[output])
+                result[output] = path
+        return result
+
+    def source(self, request, name):
+        if name in request:
+            return request[name]
+        if name + '_file' in request:
+            with open(request[name + '_file'], 'rb') as f:
+                return f.read()
+        raise Exception('Missing ' + name + ' (or ' + name + '_file) in request')
+
+    def serve(self, lines, out):
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {'id': None, 'ok': False, 'error': 'Invalid JSON: ' + str(e)}
+            else:
+                response = self.handle(request)
+            out.write(json.dumps(response) + '\n')
+            out.flush()
+
+#-----------------------------------------------
+# Unix socket
+#-----------------------------------------------
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        lines = (line.decode('utf-8') for line in self.rfile)
+        self.server.conversion_server.serve(lines, LineWriter(self.wfile))
+
+class LineWriter:
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.wfile.flush()
+
+#-----------------------------------------------
+# Main
+#-----------------------------------------------
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Converts E-PDDL problems sent as JSON lines, keeping the parsed domains in memory.')
+    arg_parser.add_argument('--socket', metavar='PATH', help='listen on a Unix socket instead of stdin/stdout')
+    arg_parser.add_argument('--cache-size', type=int, default=16, metavar='N', help='number of parsed domains kept in memory')
+    args = arg_parser.parse_args()
+    conversion_server = ConversionServer(args.cache_size)
+    if args.socket is None:
+        conversion_server.serve(sys.stdin, sys.stdout)
+    else:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        with socketserver.UnixStreamServer(args.socket, RequestHandler) as server:
+            server.conversion_server = conversion_server
+            server.serve_forever()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+import contextlib
+import io
+import os
+import re
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import generator
+from EPDDL import EPDDL_Parser
+
+def words(text):
+    return re.split(r'[^\w-]+', text)
+
+class TestGenerator(unittest.TestCase):
+
+    def test_negated_beliefs_convert(self):
+        # The generated :init has negations nested under beliefs, as in
+        # ([a0]([a1](not (p0 i1 i2)))): no 'not' is left in the conversions
+        params = generator.parameters(init = 30)
+        problem = generator.generate_problem(params)
+        self.assertRegex(problem, r'\(\[\w+\]\(\[\w+\]\(not ')
+        parser = EPDDL_Parser()
+        parser.parse_domain_text(generator.generate_domain(params))
+        parser.parse_problem_text(problem)
+        # The PDKB printer warns about forall/diff on stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs = [parser.to_efp()] + list(parser.to_pdkb())
+        for text in outputs:
+            self.assertEqual([word for word in words(text) if 'not' in word], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from EPDDL import EPDDL_Parser
+
+EXAMPLES = os.path.join(ROOT, 'examples', 'coin_in_the_box')
+
+class TestParseProblem(unittest.TestCase):
+
+    def test_two_problems_in_a_row(self):
+        # A parser that parses a second problem converts it as a fresh one would
+        with open(os.path.join(EXAMPLES, 'coininthebox.epddl')) as f:
+            domain = f.read()
+        with open(os.path.join(EXAMPLES, 'pb1.epddl')) as f:
+            problem = f.read()
+        parser = EPDDL_Parser()
+        parser.parse_domain_text(domain)
+        parser.parse_problem_text(problem)
+        first = parser.to_efp()
+        parser.parse_problem_text(problem)
+        self.assertEqual(parser.to_efp(), first)
+
+        fresh = EPDDL_Parser()
+        fresh.parse_domain_text(domain)
+        fresh.parse_problem_text(problem)
+        self.assertEqual(parser.objects, fresh.objects)
+
+if __name__ == '__main__':
+    unittest.main()
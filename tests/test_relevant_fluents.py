@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from EPDDL import EPDDL_Parser
+
+EXAMPLES = os.path.join(ROOT, 'examples', 'coin_in_the_box')
+
+PROBLEM = '''(define (problem nested)
+  (:domain coininthebox)
+  (:agents a b c)
+  (:depth 2)
+  (:init (tail) (has_key a) (looking a) ([a]([b](not (has_key c)))) ([a b c](looking a)))
+  (:goal ([b](opened)))
+)'''
+
+def declared(text, keyword):
+    # The items of the 'keyword item, item, ...;' lines of a mAp file
+    items = []
+    for line in text.split('\n'):
+        if line.startswith(keyword + ' '):
+            items += line[len(keyword) + 1:].rstrip(';').split(', ')
+    return items
+
+class TestRelevantFluents(unittest.TestCase):
+
+    def test_nested_negated_belief(self):
+        parser = EPDDL_Parser()
+        parser.parse_domain(os.path.join(EXAMPLES, 'coininthebox.epddl'))
+        parser.parse_problem_text(PROBLEM)
+        text = parser.to_efp(relevant = True)
+        fluents = declared(text, 'fluent')
+        self.assertIn('has_key_c', fluents)
+        self.assertNotIn('not', fluents)
+        self.assertNotIn('-not', declared(text, 'initially'))
+        self.assertIn('B(a,B(b,-has_key_c))', declared(text, 'initially'))
+
+if __name__ == '__main__':
+    unittest.main()
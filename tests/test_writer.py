@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+import hashlib
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from writer import OutputWriter
+
+class TestOutputWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'out.txt')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_digest_written_on_success(self):
+        with OutputWriter.open(self.path, digest = True) as out:
+            out.write('some text\n')
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'some text\n')
+        with open(self.path + '.sha256') as f:
+            self.assertEqual(f.read(), hashlib.sha256(b'some text\n').hexdigest() + '\n')
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ['out.txt', 'out.txt.sha256'])
+
+    def test_failed_body_leaves_no_output(self):
+        with self.assertRaises(ValueError):
+            with OutputWriter.open(self.path, digest = True) as out:
+                out.write('header\n')
+                out.flush()
+                raise ValueError('printing failed')
+        self.assertEqual(os.listdir(self.folder.name), [])
+
+    def test_failed_body_keeps_previous_output(self):
+        for compression in (None, 'gzip', 'xz'):
+            with OutputWriter.open(self.path, compression, True) as out:
+                out.write('complete\n')
+            files = sorted(os.listdir(self.folder.name))
+            with self.assertRaises(ValueError):
+                with OutputWriter.open(self.path, compression, True) as out:
+                    out.write('partial\n')
+                    raise ValueError('printing failed')
+            self.assertEqual(sorted(os.listdir(self.folder.name)), files)
+            with open(self.path + '.sha256') as f:
+                self.assertEqual(f.read(), hashlib.sha256(b'complete\n').hexdigest() + '\n')
+
+if __name__ == '__main__':
+    unittest.main()
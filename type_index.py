@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+class TypeIndex:
+
+    # The objects of each type (its own objects or, if it has none, the ones
+    # of its subtypes) and the types of each object, computed once per
+    # problem. The objects of a type are deduplicated, keeping the order in
+    # which the type hierarchy has always been walked (a stack over the
+    # subtypes), so that grounding order does not change.
+
+    #-----------------------------------------------
+    # Initialize
+    #-----------------------------------------------
+
+    def __init__(self, objects, types):
+        self.objects = {}
+        self.unrecognized = {}
+        names = list(objects) + list(types)
+        for subtypes in types.values():
+            names += subtypes
+        for name in names:
+            if name not in self.objects and name not in self.unrecognized:
+                self.add_type(name, objects, types)
+        self.types = {}
+        for name, items in self.objects.items():
+            for obj in items:
+                if obj not in self.types:
+                    self.types[obj] = []
+                self.types[obj].append(name)
+
+    def add_type(self, name, objects, types):
+        type_stack = [name]
+        items = []
+        while type_stack:
+            t = type_stack.pop()
+            if t in self.objects:
+                items += self.objects[t]
+            elif t in objects:
+                items += objects[t]
+            elif t in types:
+                type_stack += types[t]
+            else:
+                self.unrecognized[name] = t
+                return
+        self.objects[name] = tuple(dict.fromkeys(items))
+
+    #-----------------------------------------------
+    # Lookups
+    #-----------------------------------------------
+
+    def objects_of(self, type):
+        items = self.objects.get(type)
+        if items is None:
+            raise Exception('Unrecognized type ' + self.unrecognized.get(type, type))
+        return items
+
+    def types_of(self, obj):
+        return self.types.get(obj, [])
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# Four spaces as indentation [no tabs]
+
+import gzip
+import hashlib
+import io
+import itertools
+import lzma
+import os
+import uuid
+
+def gzip_file(raw, path):
+    # gzip keeps the name of the file in its header: the final one, not the temporary one
+    return gzip.GzipFile(path, 'wb', fileobj = raw)
+
+def xz_file(raw, path):
+    return lzma.LZMAFile(raw, 'wb')
+
+# Supported compressions: name -> (file extension, compressor of a binary file)
+COMPRESSIONS = {'gzip': ('.gz', gzip_file), 'xz': ('.xz', xz_file)}
+
+class OutputWriter:
+
+    # The printers write many small strings (a comma, a ';\n', a fluent).
+    # The writer collects them and hands them to the sink joined in large
+    # chunks. The sink can be any object with a write method: a file, a
+    # gzip/lzma file, an io.StringIO or sys.stdout.
+    # write is the append of the buffer list, so that a fragment costs no
+    # more than a list append: the printers call checkpoint after each
+    # block (e.g. a ground action) to keep the buffer bounded.
+    # With digest = True the writer also computes the SHA-256 of the text.
+    # written is the number of characters handed to the sink so far.
+    # A file opened by open is written under a temporary name and renamed
+    # when the writer is closed: if the printing fails, the file (and its
+    # digest) is left as it was.
+
+    #-----------------------------------------------
+    # Initialize
+    #-----------------------------------------------
+
+    def __init__(self, sink, close_sink = False, buffer_parts = 1 << 16, digest = False):
+        self.sink = sink
+        self.close_sink = close_sink
+        self.buffer_parts = buffer_parts
+        self.parts = []
+        self.write = self.parts.append
+        self.digest = None
+        self.digest_path = None
+        # The binary file, its temporary and its final name for a file opened by open
+        self.raw = None
+        self.temporary_path = None
+        self.path = None
+        self.written = 0
+        if digest:
+            self.digest = hashlib.sha256()
+
+    @staticmethod
+    def open(path, compression = None, digest = False):
+        # Opens path for writing (adding the extension of the compression, if any).
+        # With digest = True, the SHA-256 of the (uncompressed) text is written
+        # to path + '.sha256' when the writer is closed
+        if compression is None:
+            extension, compressor = '', None
+        elif compression in COMPRESSIONS:
+            extension, compressor = COMPRESSIONS[compression]
+        else:
+            raise Exception('Unknown compression ' + compression + '. Please select one of the following: ' + ', '.join(COMPRESSIONS))
+        # Unique, so that concurrent writers of the same file never share it
+        temporary_path = path + extension + '.' + uuid.uuid4().hex + '.tmp'
+        raw = open(temporary_path, 'wb')
+        if compressor is None:
+            sink = io.TextIOWrapper(raw)
+        else:
+            sink = io.TextIOWrapper(compressor(raw, path + extension))
+        writer = OutputWriter(sink, True, digest = digest)
+        writer.raw = raw
+        writer.temporary_path = temporary_path
+        writer.path = path + extension
+        if digest:
+            writer.digest_path = path + '.sha256'
+        return writer
+
+    #-----------------------------------------------
+    # Write
+    #-----------------------------------------------
+
+    def checkpoint(self):
+        if len(self.parts) >= self.buffer_parts:
+            self.flush()
+
+    def write_sets(self, keyword, items, size = 10):
+        # Writes 'keyword item, item, ...;' lines of (at most) size items,
+        # e.g. the 'fluent', 'action' and 'agent' declarations of mAp
+        items = iter(items)
+        self.write(keyword + ' ' + ', '.join(itertools.islice(items, size)))
+        line = list(itertools.islice(items, size))
+        while line:
+            self.write(';\n' + keyword + ' ' + ', '.join(line))
+            line = list(itertools.islice(items, size))
+        self.write(';')
+
+    def copy(self, source):
+        # Copies the content of an open file to the sink
+        self.flush()
+        chunk = source.read(1 << 20)
+        while chunk:
+            self.sink.write(chunk)
+            self.written += len(chunk)
+            if self.digest is not None:
+                self.digest.update(chunk.encode('utf-8'))
+            chunk = source.read(1 << 20)
+
+    def flush(self):
+        if self.parts:
+            chunk = ''.join(self.parts)
+            self.sink.write(chunk)
+            self.written += len(chunk)
+            if self.digest is not None:
+                self.digest.update(chunk.encode('utf-8'))
+            self.parts.clear()
+
+    def hexdigest(self):
+        # The SHA-256 of the text written so far (None without digest)
+        if self.digest is None:
+            return None
+        self.flush()
+        return self.digest.hexdigest()
+
+    def close(self, completed = True):
+        # With completed = False (the printing failed) the buffered text is
+        # dropped, a file opened by open is removed and no digest is written
+        if completed:
+            self.flush()
+        else:
+            self.parts.clear()
+        if self.close_sink:
+            self.sink.close()
+        elif hasattr(self.sink, 'flush'):
+            self.sink.flush()
+        if self.raw is not None:
+            # A compressor does not close the file it writes to
+            self.raw.close()
+            self.raw = None
+        if self.temporary_path is not None:
+            if completed:
+                os.replace(self.temporary_path, self.path)
+            else:
+                os.remove(self.temporary_path)
+            self.temporary_path = None
+        if self.digest_path is not None and completed:
+            temporary_path = self.digest_path + '.' + uuid.uuid4().hex + '.tmp'
+            with open(temporary_path, 'w') as out:
+                out.write(self.digest.hexdigest() + '\n')
+            os.replace(temporary_path, self.digest_path)
+        self.digest_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(exc_type is None)